@@ -0,0 +1,746 @@
+# -*- coding: utf-8 -*-
+"""
+    correlation 的基准测试以及准确率回归检查
+
+    按随机种子生成可复现的姓名与邮箱语料，邮箱由姓名经过算法能够识别的变换生成
+    （全名、截断、倒序、片段组合、首字母以及数字噪声），并混入与姓名无关的干扰邮箱。
+    在 邮箱数 × 姓名数 × 名字单词数 的网格上统计吞吐量、单条记录延迟（p50/p99）以及内存峰值，
+    同时以生成时的真实结果计算准确率，并检查各个匹配选项的结果与参考结果完全一致。
+    另外在随机的小规模权重上把一对一分配与穷举结果对比（并统计大规模稀疏权重上一对一分配的耗时），并检查把姓名分片匹配后合并的结果、
+    以及把邮箱和姓名分批加入匹配会话的结果与一次匹配相同；
+    姓名特征索引文件（包括记录被损坏后重新构造的文件）、correlate_many、correlate_stream 以及命令行的结果与
+    correlation 相同；服务把同一姓名列表的并发请求合并计算后，每个请求的结果与单独调用 correlation 相同。
+
+    e.g. python benchmark.py --emails 5 20 --authors 10 100 --words 2 4 6
+         python benchmark.py --baseline bench_baseline.json
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+import unicodedata
+
+import correlation_algorithm
+from correlation_algorithm import (NON_WORD_CHARACTER_REGEX, PROFILE_INDEX_HEADER, PROFILE_INDEX_OFFSET, WEIGHT_THRESHOLD,
+                                   CorrelationSession, CorrelationStats, ProfileIndex, ProfileIndexError, Storager, assign_one_to_one,
+                                   clear_caches, correlate_many, correlate_stream, correlation,
+                                   find_fragment_sequences)
+from correlation_server import CorrelationServer, percentile
+
+# 构造名字用的音节
+SYLLABLES = [
+    'ka', 'zu', 'hi', 'ro', 'yo', 'ne', 'da', 'ta', 'shi', 'mar', 'tha', 'ire', 'bu', 'cio', 'tor', 'res',
+    'san', 'dro', 'per', 'ca', 'rio', 'li', 'ng', 'zhang', 'yan', 'an', 'jo', 'se', 'ric', 'ar', 'do', 'vi',
+    'ei', 'ra', 'pow', 'ell', 'dan', 'iel', 'mi', 'chel', 'er', 'so', 'uza', 'fe', 'rrei', 'go', 'mes',
+    'fa', 'el', 'qua', 'dros', 'gon', 'za', 'lez', 'nu', 'bor', 'na', 'bhat', 'ta', 'char', 'jee', 'kun',
+]
+
+# 带音调的字母
+ACCENTS = {
+    'a': 'á', 'e': 'é', 'i': 'í', 'o': 'ô', 'u': 'ü', 'c': 'ç', 'n': 'ñ',
+}
+
+# 邮箱的生成方式
+TRANSFORMS = ('full', 'truncation', 'reversal', 'fragments', 'initials', 'initial_last')
+
+# 干扰邮箱
+DISTRACTOR = 'distractor'
+
+# 参与对比的匹配选项，第一个为参考结果
+VARIANTS = [
+    ('regex', {}),
+    ('regex+prune', {'prune': True}),
+    ('aho-corasick', {'engine': 'aho-corasick'}),
+    ('aho-corasick+prune', {'engine': 'aho-corasick', 'prune': True}),
+    ('regex+early-exit', {'early_exit': True}),
+    ('aho-corasick+prune+early-exit', {'engine': 'aho-corasick', 'prune': True, 'early_exit': True}),
+]
+# 向量化上界需要 NumPy
+if correlation_algorithm.numpy is not None:
+    VARIANTS.append(('regex+vectorized', {'vectorized': True}))
+
+# 姓名数量规模测试使用的匹配选项，第一个为参考结果
+SCALING_VARIANTS = ('regex+prune', 'aho-corasick', 'aho-corasick+prune')
+
+# 分片检查中合并结果时使用的 (top_k, min_margin)
+SHARD_STORAGER_OPTIONS = [(1, None), (3, None), (2, 0.5)]
+
+
+def generate_word(rng):
+    word = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3)))
+    # 小语种音调
+    if rng.random() < 0.15:
+        index = rng.randrange(len(word))
+        word = word[:index] + ACCENTS.get(word[index], word[index]) + word[index + 1:]
+    return word.capitalize()
+
+
+def generate_name(rng, words_count):
+    """
+        生成姓名：多单词、带音调、连字符、单字母缩写、姓氏大写前置等情况
+    """
+    words = [generate_word(rng) for _ in range(words_count)]
+    # 中间名只保留首字母
+    if words_count >= 3 and rng.random() < 0.3:
+        index = rng.randrange(1, words_count - 1)
+        words[index] = words[index][0] + rng.choice(['', '.'])
+    # 姓氏大写并前置
+    if rng.random() < 0.2:
+        words = [words[-1].upper()] + words[:-1]
+    name = ' '.join(words)
+    # 复姓使用连字符连接
+    if words_count >= 2 and rng.random() < 0.15:
+        name = name.replace(' ', '-', 1)
+    return name
+
+
+def generate_letter_name(rng, words_count):
+    """
+        生成由随机字母组成的姓名，不同姓名几乎不共享音节，命中某个邮箱的姓名数量与姓名总数无关
+    """
+    return ' '.join(
+        ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 8))).capitalize()
+        for _ in range(words_count)
+    )
+
+
+def _ascii_words(name):
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode().lower()
+    return [word for word in NON_WORD_CHARACTER_REGEX.split(name) if word]
+
+
+def derive_email_user(rng, name, transform):
+    """
+        按算法能够识别的变换由姓名生成邮箱用户名部分
+    """
+    words = _ascii_words(name)
+    long_words = [word for word in words if len(word) > 1] or words
+    if transform == 'full':
+        user = ''.join(long_words)
+    elif transform == 'truncation':
+        user = long_words[0][:rng.randint(4, 6)] + long_words[-1]
+    elif transform == 'reversal':
+        user = rng.choice(long_words)[::-1]
+    elif transform == 'fragments':
+        picked = rng.sample(long_words, min(len(long_words), rng.randint(2, 3)))
+        user = ''.join(word[:rng.choice([2, 3])] for word in picked)
+    elif transform == 'initials':
+        user = ''.join(word[0] for word in words)
+    else:
+        user = words[0][0] + long_words[-1]
+    # 数字噪声
+    if rng.random() < 0.3:
+        user += str(rng.randint(1, 99))
+    return user
+
+
+def generate_record(rng, emails_count, authors_count, words_count, distractor_ratio=0.2, name_generator=generate_name):
+    """
+        生成一条记录
+    :param name_generator:  生成姓名的函数
+    :return:                (邮箱列表, 姓名列表, {邮箱: (真实姓名或 None, 生成方式)})
+    """
+    author_list = []
+    while len(author_list) < authors_count:
+        name = name_generator(rng, words_count)
+        if name not in author_list:
+            author_list.append(name)
+
+    email_list = []
+    truth = {}
+    attempts = 0
+    while len(email_list) < emails_count and attempts < emails_count * 10:
+        attempts += 1
+        domain = rng.choice(['example.org', 'mail.example.edu', 'example.ac.jp'])
+        if rng.random() < distractor_ratio:
+            user = ''.join(rng.choice('bcdfghjklmnpqrstvwxz') for _ in range(rng.randint(3, 8)))
+            owner, transform = None, DISTRACTOR
+        else:
+            owner = rng.choice(author_list)
+            transform = rng.choice(TRANSFORMS)
+            user = derive_email_user(rng, owner, transform)
+        email = '%s@%s' % (user, domain)
+        if email in truth:
+            continue
+        email_list.append(email)
+        truth[email] = (owner, transform)
+    return email_list, author_list, truth
+
+
+def generate_corpus(seed, records, emails_count, authors_count, words_count):
+    rng = random.Random('%s-%s-%s-%s' % (seed, emails_count, authors_count, words_count))
+    return [generate_record(rng, emails_count, authors_count, words_count) for _ in range(records)]
+
+
+def run_corpus(corpus, measure_memory=True, **options):
+    """
+        对语料运行 correlation，统计耗时、内存以及结果
+    """
+    results = []
+    latencies = []
+    stats = CorrelationStats()
+    # 每个选项都从空的姓名特征缓存开始
+    clear_caches()
+    for email_list, author_list, _ in corpus:
+        started = time.perf_counter()
+        result = correlation(email_list=email_list, author_list=author_list, keep_original=True, verbose=False,
+                             stats=stats, **options)
+        latencies.append(time.perf_counter() - started)
+        results.append(result)
+
+    peak_memory = None
+    if measure_memory:
+        clear_caches()
+        tracemalloc.start()
+        for email_list, author_list, _ in corpus:
+            correlation(email_list=email_list, author_list=author_list, keep_original=True, verbose=False, **options)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    total = sum(latencies)
+    return {
+        'results': results,
+        'seconds': total,
+        'pairs_per_second': stats.pairs / total if total else 0.0,
+        'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99),
+        'peak_memory': peak_memory,
+        'stats': stats,
+    }
+
+
+def run_scaling(seed, authors_counts, emails_count, words_count, variants, repeats=3):
+    """
+        按姓名数量重复匹配同一份姓名列表（例如固定的作者名册），统计每个邮箱的耗时以及实际计算权重的组合数，
+        用于确认每个邮箱的耗时不随姓名数量增长；第一次调用需要构造姓名特征以及自动机，单独统计
+        姓名由随机字母组成，命中每个邮箱的姓名数量基本不变（音节构成的姓名越多，真正匹配的姓名也越多）
+    :param variants:    [(名称, 匹配选项)]，第一个为参考结果
+    :return:            每个 (姓名数量, 选项) 一行
+    """
+    rows = []
+    for authors_count in authors_counts:
+        rng = random.Random('%s-scaling-%s-%s-%s' % (seed, emails_count, authors_count, words_count))
+        email_list, author_list, _ = generate_record(rng, emails_count, authors_count, words_count,
+                                                     name_generator=generate_letter_name)
+        reference = None
+        for name, options in variants:
+            clear_caches()
+            started = time.perf_counter()
+            correlation(email_list=email_list, author_list=author_list, keep_original=True, verbose=False, **options)
+            first_seconds = time.perf_counter() - started
+            seconds = []
+            for _ in range(repeats):
+                stats = CorrelationStats()
+                started = time.perf_counter()
+                result = correlation(email_list=email_list, author_list=author_list, keep_original=True,
+                                     verbose=False, stats=stats, **options)
+                seconds.append(time.perf_counter() - started)
+            if reference is None:
+                reference = result
+            rows.append({
+                'authors': authors_count,
+                'variant': name,
+                'first_ms_per_email': first_seconds * 1000 / len(email_list),
+                'ms_per_email': min(seconds) * 1000 / len(email_list),
+                'scored_per_email': stats.pairs_scored / len(email_list),
+                'mismatches': int(result != reference),
+            })
+    return rows
+
+
+def accuracy(corpus, results):
+    """
+        以生成时的真实结果计算准确率
+    :return:    {生成方式: [正确数, 总数]}
+    """
+    counter = {}
+    for (_, _, truth), result in zip(corpus, results):
+        for email, (owner, transform) in truth.items():
+            correct = result.get(email) == owner
+            transform_counter = counter.setdefault(transform, [0, 0])
+            transform_counter[0] += int(correct)
+            transform_counter[1] += 1
+    return counter
+
+
+def brute_force_assignment_weight(email_weights):
+    """
+        穷举所有一对一分配方式，返回最大的权重总和，只用于小规模的检查
+    """
+    emails = list(email_weights)
+
+    def best(index, used):
+        if index == len(emails):
+            return 0
+        # 当前邮箱不分配名字
+        result = best(index + 1, used)
+        for name, weight in email_weights[emails[index]].items():
+            if name not in used:
+                result = max(result, weight + best(index + 1, used | {name}))
+        return result
+
+    return best(0, frozenset())
+
+
+def check_one_to_one(seed, trials):
+    """
+        在随机的小规模权重上把 assign_one_to_one 与穷举结果对比
+    :return:    分配不合法（名字重复或不是候选名字）或权重总和不是最大的次数
+    """
+    rng = random.Random('%s-one-to-one' % seed)
+    mismatches = 0
+    for _ in range(trials):
+        emails_count = rng.randint(1, 6)
+        names_count = rng.randint(1, 6)
+        # 只保留一位小数，制造权重相同的情况；部分邮箱没有候选名字
+        email_weights = {
+            'e%d' % row: {
+                'n%d' % column: round(rng.uniform(WEIGHT_THRESHOLD + 0.1, 6), 1)
+                for column in range(names_count) if rng.random() < 0.5
+            }
+            for row in range(emails_count)
+        }
+        assignment = assign_one_to_one(email_weights)
+        valid = len(set(assignment.values())) == len(assignment) and all(
+            name in email_weights.get(email, ()) for email, name in assignment.items()
+        )
+        if not valid or abs(sum(email_weights[email][name] for email, name in assignment.items())
+                            - brute_force_assignment_weight(email_weights)) > 1e-6:
+            mismatches += 1
+    return mismatches
+
+
+def run_one_to_one_scaling(seed, shapes):
+    """
+        在大规模稀疏权重上统计 assign_one_to_one 的耗时：每个邮箱随机连接若干个名字，所有邮箱属于同一个连通部分
+    :param shapes:  [(邮箱数量（同时也是名字数量）, 每个邮箱的名字数量)]
+    :return:        [{emails, edges, seconds, assigned, mismatches}]，mismatches 为分配不合法时的 1
+    """
+    rows = []
+    for emails_count, edges_count in shapes:
+        rng = random.Random('%s-one-to-one-%dx%d' % (seed, emails_count, edges_count))
+        email_weights = {
+            'e%d' % row: {
+                'n%d' % column: round(rng.uniform(WEIGHT_THRESHOLD + 0.1, 6), 1)
+                for column in rng.sample(range(emails_count), edges_count)
+            }
+            for row in range(emails_count)
+        }
+        started = time.perf_counter()
+        assignment = assign_one_to_one(email_weights)
+        seconds = time.perf_counter() - started
+        valid = len(set(assignment.values())) == len(assignment) and all(
+            name in email_weights[email] for email, name in assignment.items()
+        )
+        rows.append({
+            'emails': emails_count,
+            'edges': edges_count,
+            'seconds': seconds,
+            'assigned': len(assignment),
+            'mismatches': 0 if valid else 1,
+        })
+    return rows
+
+
+def check_fragment_limit():
+    """
+        构造超过片段组合搜索状态上限的文本：前一部分只有一种组合，后一部分每个位置都能由大量单词匹配，
+        检查只返回前一部分的组合并计入 CorrelationStats.pairs_fragment_capped
+    :return:    结果或计数不正确时为 1
+    """
+    # 第 0、1 行只在前一部分命中，其余每一行在后一部分除自己的位置以外的每个偶数位置命中
+    prefix = 'xyzw-'
+    text = prefix + 'ab' * 30
+
+    def fragments_at(position):
+        if position < len(prefix):
+            return [(position // 2, 2)] if position in (0, 2) else []
+        offset = position - len(prefix)
+        if offset % 2:
+            return []
+        return [(row_index, 2) for row_index in range(2, 22) if offset // 2 != row_index]
+
+    stats = CorrelationStats()
+    match_result = find_fragment_sequences(text, fragments_at, stats=stats)
+    return 0 if match_result == ['xyzw'] and stats.pairs_fragment_capped == 1 else 1
+
+
+def check_shards(corpus, rng, variants, shards_count=3):
+    """
+        把每条记录的姓名随机分到多个分片分别匹配，检查 Storager.merge 以及 dump/load 合并的结果
+        （最优名字以及候选名字）与一次匹配所有姓名的结果相同
+    :param variants:    [(名称, 匹配选项)]，每条记录随机选择一个
+    :return:            结果不同的记录数
+    """
+    mismatches = 0
+    for email_list, author_list, _ in corpus:
+        options = rng.choice(variants)[1]
+        positions_list = [[] for _ in range(shards_count)]
+        for position in range(len(author_list)):
+            positions_list[rng.randrange(shards_count)].append(position)
+
+        storagers = []
+        dumped = []
+        for positions in positions_list:
+            storager = Storager(keep_log=True)
+            correlation(email_list=email_list, author_list=[author_list[position] for position in positions],
+                        keep_original=True, verbose=False, storager=storager, author_positions=positions, **options)
+            storagers.append(storager)
+            output_file = io.StringIO()
+            storager.dump(output_file)
+            dumped.append(output_file.getvalue())
+
+        different = False
+        for top_k, min_margin in SHARD_STORAGER_OPTIONS:
+            reference = Storager(top_k=top_k, min_margin=min_margin)
+            correlation(email_list=email_list, author_list=author_list, keep_original=True, verbose=False,
+                        storager=reference, **options)
+            merged = Storager.merge(storagers, top_k=top_k, min_margin=min_margin)
+            loaded = Storager.load([io.StringIO(content) for content in dumped], top_k=top_k, min_margin=min_margin)
+            for storager in (merged, loaded):
+                if storager.email_owners != reference.email_owners:
+                    different = True
+                # 只保留一个名字时一次匹配不记录候选名字
+                if reference.track_candidates and storager.email_candidates != reference.email_candidates:
+                    different = True
+        mismatches += different
+    return mismatches
+
+
+def check_session(corpus, rng, variants, top_k=3):
+    """
+        把每条记录的邮箱和姓名随机交错、分批加入 CorrelationSession，检查最优名字、每批返回的名字变化累计的结果
+        以及候选名字与一次匹配所有邮箱和姓名的结果相同
+    :param variants:    [(名称, 匹配选项)]，每条记录随机选择一个
+    :return:            结果不同的记录数
+    """
+    mismatches = 0
+    for email_list, author_list, _ in corpus:
+        options = rng.choice(variants)[1]
+        session = CorrelationSession(keep_original=True, storager=Storager(top_k=top_k), **options)
+        changed_owners = {}
+        email_index = author_index = 0
+        while email_index < len(email_list) or author_index < len(author_list):
+            if author_index >= len(author_list) or (email_index < len(email_list) and rng.random() < 0.5):
+                batch_size = rng.randint(1, 3)
+                changed_owners.update(session.add_emails(email_list[email_index:email_index + batch_size]))
+                email_index += batch_size
+            else:
+                batch_size = rng.randint(1, 4)
+                changed_owners.update(session.add_authors(author_list[author_index:author_index + batch_size]))
+                author_index += batch_size
+
+        reference = Storager(top_k=top_k)
+        correlation(email_list=email_list, author_list=author_list, keep_original=True, verbose=False,
+                    storager=reference, **options)
+        reference_owners = reference.email_owners
+        if (session.email_owners != reference_owners or changed_owners != reference_owners
+                or session.storager.email_candidates != reference.email_candidates):
+            mismatches += 1
+    return mismatches
+
+
+def check_profile_index(corpus, rng, variants):
+    """
+        为每条记录构造姓名特征索引文件，检查使用索引的结果与不使用索引时相同；
+        再随机修改一条记录中的一个字节，检查打开时报告损坏、open_or_build 重新构造后结果仍然相同
+    :param variants:    [(名称, 匹配选项)]，每条记录随机选择一个
+    :return:            结果不同、损坏未被发现或未被重新构造的记录数
+    """
+    mismatches = 0
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'profiles.idx')
+        for email_list, author_list, _ in corpus:
+            options = rng.choice(variants)[1]
+            reference = correlation(email_list=email_list, author_list=author_list, keep_original=True, verbose=False,
+                                    **options)
+            # 从空的姓名特征缓存开始，确保特征从索引文件读取
+            clear_caches()
+            index = ProfileIndex.open_or_build(path, author_list)
+            different = correlation(email_list=email_list, author_list=author_list, keep_original=True,
+                                    verbose=False, profile_index=index, **options) != reference
+            index.close()
+
+            # 修改记录部分的一个字节
+            with open(path, 'rb') as index_file:
+                content = bytearray(index_file.read())
+            _, _, _, _, count, names_size = PROFILE_INDEX_HEADER.unpack_from(content, 0)
+            records_offset = PROFILE_INDEX_HEADER.size + names_size + (count + 1) * PROFILE_INDEX_OFFSET.size
+            if records_offset < len(content):
+                content[rng.randrange(records_offset, len(content))] ^= 0x20
+                with open(path, 'wb') as index_file:
+                    index_file.write(content)
+                try:
+                    ProfileIndex(path).close()
+                except ProfileIndexError:
+                    pass
+                else:
+                    different = True
+
+            clear_caches()
+            index = ProfileIndex.open_or_build(path, author_list)
+            if correlation(email_list=email_list, author_list=author_list, keep_original=True, verbose=False,
+                           profile_index=index, **options) != reference:
+                different = True
+            index.close()
+            mismatches += different
+    return mismatches
+
+
+def check_batch(corpus, variants):
+    """
+        检查 correlate_many（线程池，以及通过路径共享姓名特征索引文件的进程池）、correlate_stream 以及命令行的结果
+        与逐条调用 correlation 相同
+    :param variants:    [(名称, 匹配选项)]
+    :return:            结果不同的 (匹配选项, 入口) 数量
+    """
+    records = [(email_list, author_list) for email_list, author_list, _ in corpus]
+    mismatches = 0
+    with tempfile.TemporaryDirectory() as directory:
+        index = ProfileIndex.build(os.path.join(directory, 'profiles.idx'),
+                                   [author for _, author_list in records for author in author_list])
+        input_path = os.path.join(directory, 'records.jsonl')
+        output_path = os.path.join(directory, 'owners.jsonl')
+        with open(input_path, 'w', encoding='utf-8') as input_file:
+            for email_list, author_list in records:
+                input_file.write(json.dumps({'email_list': email_list, 'author_list': author_list},
+                                            ensure_ascii=False) + '\n')
+
+        for _, options in variants:
+            reference = [
+                correlation(email_list=email_list, author_list=author_list, keep_original=True, verbose=False,
+                            **options)
+                for email_list, author_list in records
+            ]
+            mismatches += list(correlate_many(records, workers=2, chunksize=3, executor='thread', keep_original=True,
+                                              **options)) != reference
+            mismatches += list(correlate_many(records, workers=2, chunksize=3, executor='process', keep_original=True,
+                                              profile_index=index, **options)) != reference
+
+            # correlate_stream 以及命令行只产出匹配到名字的邮箱
+            reference_owners = [
+                {email: name for email, name in result.items() if name is not None} for result in reference
+            ]
+            stream_owners = [
+                {email: name for email, name, _ in correlate_stream([record], keep_original=True, **options)}
+                for record in records
+            ]
+            mismatches += stream_owners != reference_owners
+
+            argv = [input_path, '-o', output_path, '--keep-original', '--engine', options.get('engine', 'regex')]
+            argv += ['--%s' % option.replace('_', '-') for option in ('prune', 'vectorized', 'early_exit')
+                     if options.get(option)]
+            correlation_algorithm.main(argv)
+            cli_owners = [{} for _ in records]
+            with open(output_path, encoding='utf-8') as output_file:
+                for line in output_file:
+                    row = json.loads(line)
+                    cli_owners[row['id']][row['email']] = row['name']
+            mismatches += cli_owners != reference_owners
+        index.close()
+    return mismatches
+
+
+def check_server(corpus, rng):
+    """
+        把每条记录的邮箱随机分成多个请求，并发发送给使用线程池的 CorrelationServer，
+        检查同一姓名列表的请求被合并计算后，每个请求的结果与单独调用 correlation 相同
+    :return:    结果不同或出错的请求数
+    """
+    requests = []
+    for email_list, author_list, _ in corpus:
+        keep_original = rng.random() < 0.5
+        position = 0
+        while position < len(email_list):
+            batch_size = rng.randint(1, 3)
+            requests.append({'id': len(requests), 'email_list': email_list[position:position + batch_size],
+                             'author_list': author_list, 'keep_original': keep_original})
+            position += batch_size
+
+    async def send():
+        server = CorrelationServer(executor='thread', workers=2)
+        try:
+            return await asyncio.gather(*[server.handle(request) for request in requests]), server.metrics()
+        finally:
+            server.close()
+
+    responses, metrics = asyncio.run(send())
+    mismatches = 0
+    for request, response in zip(requests, responses):
+        reference = correlation(email_list=request['email_list'], author_list=request['author_list'],
+                                keep_original=request['keep_original'], verbose=False)
+        mismatches += response.get('result') != reference
+    # 同一姓名列表的请求应当被合并
+    if metrics['batches'] > len(corpus) * 2 or metrics['errors']:
+        mismatches += 1
+    return mismatches
+
+
+def fingerprint(results):
+    """
+        结果摘要，用于与保存的基准结果对比
+    """
+    content = json.dumps(results, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark and accuracy regression check for correlation().')
+    parser.add_argument('--seed', type=int, default=1, help='random seed of the synthetic corpus')
+    parser.add_argument('--records', type=int, default=20, help='records per grid cell')
+    parser.add_argument('--emails', type=int, nargs='+', default=[5, 20], help='emails per record')
+    parser.add_argument('--authors', type=int, nargs='+', default=[10, 50], help='authors per record')
+    parser.add_argument('--words', type=int, nargs='+', default=[2, 3, 5], help='words per author name')
+    parser.add_argument('--variants', nargs='+', choices=[name for name, _ in VARIANTS],
+                        default=[name for name, _ in VARIANTS], help='matching options to compare')
+    parser.add_argument('--no-memory', action='store_true', help='skip the peak memory pass')
+    parser.add_argument('--scaling-authors', type=int, nargs='*', default=[250, 1000, 4000],
+                        help='roster sizes of the per-email scaling run, none to skip it')
+    parser.add_argument('--scaling-emails', type=int, default=200, help='emails per scaling run')
+    parser.add_argument('--check-trials', type=int, default=2000,
+                        help='random weight sets compared against the brute-force one-to-one assignment')
+    parser.add_argument('--one-to-one-shapes', nargs='*', default=['3000x10', '5000x20'],
+                        help='EMAILSxEDGES sparse one-to-one assignments to time, none to skip them')
+    parser.add_argument('--baseline', help='JSON file of result fingerprints, written if missing, compared otherwise')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    variants = [(name, options) for name, options in VARIANTS if name in args.variants]
+    report = []
+    # 与穷举或单次运行结果对比的检查
+    checks = []
+    fingerprints = {}
+    mismatches = 0
+
+    for emails_count in args.emails:
+        for authors_count in args.authors:
+            for words_count in args.words:
+                corpus = generate_corpus(args.seed, args.records, emails_count, authors_count, words_count)
+                cell = '%dx%dx%d' % (emails_count, authors_count, words_count)
+                reference = None
+                for name, options in variants:
+                    # 屏蔽调用方可能开启的打印
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        run = run_corpus(corpus, measure_memory=not args.no_memory, **options)
+                    if reference is None:
+                        reference = run['results']
+                        fingerprints[cell] = fingerprint(reference)
+                    different = sum(1 for a, b in zip(reference, run['results']) if a != b)
+                    mismatches += different
+                    counter = accuracy(corpus, run['results'])
+                    correct = sum(value[0] for value in counter.values())
+                    total = sum(value[1] for value in counter.values())
+                    report.append({
+                        'cell': cell,
+                        'variant': name,
+                        'pairs_per_second': run['pairs_per_second'],
+                        'p50_ms': run['p50'] * 1000,
+                        'p99_ms': run['p99'] * 1000,
+                        'peak_memory_kb': run['peak_memory'] / 1024 if run['peak_memory'] is not None else None,
+                        'pairs_pruned': run['stats'].pairs_pruned,
+                        'pairs_fragment_capped': run['stats'].pairs_fragment_capped,
+                        'accuracy': correct / total if total else 0.0,
+                        'accuracy_by_transform': {
+                            transform: value[0] / value[1] for transform, value in sorted(counter.items())
+                        },
+                        'mismatches': different,
+                    })
+
+                rng = random.Random('%s-%s-shards' % (args.seed, cell))
+                with contextlib.redirect_stdout(io.StringIO()):
+                    shard_mismatches = check_shards(corpus, rng, variants)
+                checks.append({'cell': cell, 'check': 'shards', 'mismatches': shard_mismatches})
+                rng = random.Random('%s-%s-session' % (args.seed, cell))
+                with contextlib.redirect_stdout(io.StringIO()):
+                    session_mismatches = check_session(corpus, rng, variants)
+                checks.append({'cell': cell, 'check': 'session', 'mismatches': session_mismatches})
+
+    scaling_variants = [(name, options) for name, options in VARIANTS if name in SCALING_VARIANTS]
+    with contextlib.redirect_stdout(io.StringIO()):
+        scaling = run_scaling(args.seed, args.scaling_authors, args.scaling_emails, 3, scaling_variants)
+    mismatches += sum(row['mismatches'] for row in scaling)
+
+    # 索引文件、批量入口以及服务只在第一个网格上检查
+    corpus = generate_corpus(args.seed, args.records, args.emails[0], args.authors[0], args.words[0])
+    cell = '%dx%dx%d' % (args.emails[0], args.authors[0], args.words[0])
+    rng = random.Random('%s-%s-profile-index' % (args.seed, cell))
+    with contextlib.redirect_stdout(io.StringIO()):
+        checks.append({'cell': cell, 'check': 'profile-index', 'mismatches': check_profile_index(corpus, rng, variants)})
+        checks.append({'cell': cell, 'check': 'batch', 'mismatches': check_batch(corpus, variants)})
+        rng = random.Random('%s-%s-server' % (args.seed, cell))
+        checks.append({'cell': cell, 'check': 'server', 'mismatches': check_server(corpus, rng)})
+
+    checks.append({'cell': '-', 'check': 'one-to-one', 'mismatches': check_one_to_one(args.seed, args.check_trials)})
+    checks.append({'cell': '-', 'check': 'fragment-limit', 'mismatches': check_fragment_limit()})
+    one_to_one_scaling = run_one_to_one_scaling(args.seed, [
+        tuple(int(value) for value in shape.split('x')) for shape in args.one_to_one_shapes
+    ])
+    mismatches += sum(row['mismatches'] for row in one_to_one_scaling)
+
+    baseline_mismatches = []
+    if args.baseline:
+        try:
+            with open(args.baseline, encoding='utf-8') as baseline_file:
+                baseline = json.load(baseline_file)
+        except FileNotFoundError:
+            with open(args.baseline, 'w', encoding='utf-8') as baseline_file:
+                json.dump(fingerprints, baseline_file, indent=1, sort_keys=True)
+        else:
+            baseline_mismatches = [
+                cell for cell, value in fingerprints.items() if cell in baseline and baseline[cell] != value
+            ]
+
+    if args.json:
+        print(json.dumps({'report': report, 'scaling': scaling, 'one_to_one_scaling': one_to_one_scaling,
+                          'checks': checks, 'fingerprints': fingerprints, 'baseline_mismatches': baseline_mismatches},
+                         indent=1))
+    else:
+        print('%-12s %-29s %12s %9s %9s %10s %9s %8s %5s' % (
+            'cell', 'variant', 'pairs/s', 'p50 ms', 'p99 ms', 'peak KiB', 'pruned', 'acc', 'diff'
+        ))
+        for row in report:
+            print('%-12s %-29s %12.0f %9.3f %9.3f %10s %9d %8.3f %5d' % (
+                row['cell'], row['variant'], row['pairs_per_second'], row['p50_ms'], row['p99_ms'],
+                '%.0f' % row['peak_memory_kb'] if row['peak_memory_kb'] is not None else '-',
+                row['pairs_pruned'], row['accuracy'], row['mismatches'],
+            ))
+        if scaling:
+            print()
+            print('%-12s %-29s %14s %9s %13s %5s' % (
+                'authors', 'variant', 'first ms/email', 'ms/email', 'scored/email', 'diff'
+            ))
+            for row in scaling:
+                print('%-12d %-29s %14.3f %9.3f %13.1f %5d' % (
+                    row['authors'], row['variant'], row['first_ms_per_email'], row['ms_per_email'],
+                    row['scored_per_email'], row['mismatches'],
+                ))
+        if one_to_one_scaling:
+            print()
+            print('%-12s %-29s %14s %9s %5s' % ('emails', 'edges per email', 'seconds', 'assigned', 'diff'))
+            for row in one_to_one_scaling:
+                print('%-12d %-29d %14.3f %9d %5d' % (
+                    row['emails'], row['edges'], row['seconds'], row['assigned'], row['mismatches'],
+                ))
+        print()
+        print('%-12s %-29s %5s' % ('cell', 'check', 'diff'))
+        for row in checks:
+            print('%-12s %-29s %5d' % (row['cell'], row['check'], row['mismatches']))
+        for cell in baseline_mismatches:
+            print('[-] Results of cell %s differ from the baseline.' % cell)
+
+    # 各选项结果不一致、检查失败或与基准结果不一致时返回非零
+    failed_checks = any(row['mismatches'] for row in checks)
+    return 1 if mismatches or failed_checks or baseline_mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,20 +1,127 @@
 # -*- coding: utf-8 -*-
 
+import os
 import re
-import itertools
+import sys
+import mmap
+import time
+import struct
+import hashlib
+import csv
+import json
+import array
+import argparse
+import functools
+import heapq
+import html
+import html.entities
+import threading
+import collections
 import unicodedata
+import concurrent.futures
+
+try:
+    import numpy
+except ImportError:  # NumPy 为可选依赖，仅向量化计算权重上界时需要
+    numpy = None
 
 NON_ALPHABET_CHARACTER_REGEX = re.compile('[^A-Za-z]')
 NON_WORD_CHARACTER_REGEX = re.compile('\W+')
+# HTML 实体，名字中的实体经常缺少分号或者全部大写，e.g. MAR&IACUTE
+HTML_ENTITY_REGEX = re.compile('&(#[0-9]+|#[xX][0-9A-Fa-f]+|[A-Za-z][A-Za-z0-9]*);?')
+
+# 名字特征的匹配阶段
+STAGE_FEATURE = 'feature'
+STAGE_FEATURE_REVERSE = 'feature_reverse'
+STAGE_FEATURE_SHOUT = 'feature_shout'
+STAGE_FIRST_CHAR_CON = 'first_char_con'
+STAGE_FIRST_CHAR = 'first_char'
+# 匹配阶段的执行顺序
+STAGES = (STAGE_FEATURE, STAGE_FEATURE_REVERSE, STAGE_FEATURE_SHOUT, STAGE_FIRST_CHAR_CON, STAGE_FIRST_CHAR)
+
+# 权重必须大于该阈值才认为匹配成功
+WEIGHT_THRESHOLD = 0.8
+
+# 权重上界的浮点误差余量，保证上界不会因舍入而小于实际权重
+BOUND_EPSILON = 1e-9
+# 向量化计算权重上界时每批邮箱数量
+VECTOR_BLOCK_SIZE = 256
+
+# 每个进程缓存的姓名特征数量，单次调用的姓名更多时扩大到该次调用的姓名数量
+PROFILE_CACHE_SIZE = 4096
+# 每个进程缓存的规范化姓名数量
+NORMALIZE_CACHE_SIZE = 65536
+# 姓名特征规则的版本，修改特征构造规则时必须增加，旧版本的索引文件会被重新构造
+FEATURE_RULES_VERSION = 2
+# 姓名特征索引文件的标识以及文件头：标识、规则版本、姓名列表摘要、偏移量表与记录的摘要、姓名数量、姓名列表长度
+# 修改文件结构时必须修改标识，旧结构的索引文件会被重新构造
+PROFILE_INDEX_MAGIC = b'GEOPROF\1'
+PROFILE_INDEX_HEADER = struct.Struct('<8sI32s32sQQ')
+PROFILE_INDEX_OFFSET = struct.Struct('<Q')
+# 权重缓存默认容量
+SCORE_CACHE_SIZE = 65536
+# 记录数少于该值时批量匹配默认使用线程池，避免启动进程的开销
+SMALL_BATCH_SIZE = 16
+# 每个进程缓存的 Aho-Corasick 自动机数量（按姓名列表）
+AUTOMATON_CACHE_SIZE = 4
+# 查找片段组合时最多搜索的状态数量，超过时片段组合阶段只计入已经找到的组合
+MAX_FRAGMENT_SEARCH_STATES = 20000
+
+
+# 候选名字：名字、权重（已计算代价）以及各阶段实际计入的权重（未计算代价）
+Candidate = collections.namedtuple('Candidate', ['name', 'weight', 'stages'])
 
 
 class Storager(object):
     """
         用于存储邮箱和姓名匹配结果的数据结构
+        每个邮箱对应一个序号，最优名字（去重后的名字序号）和权重保存在按序号排列的数组中，
+        只有需要记录候选名字时才为邮箱创建 Owner 对象
     """
 
-    def __init__(self):
+    def __init__(self, top_k=1, min_margin=None, keep_log=False):
+        """
+        :param top_k:       每个邮箱保留的候选名字数量（按权重排序）
+        :param min_margin:  最优名字与次优名字的最小权重差，差值不足的邮箱不出现在 email_owners 中
+        :param keep_log:    是否记录每个邮箱所有超过阈值的候选名字，用于写出以及合并不同姓名分片的结果
+        """
+        if top_k < 1:
+            raise ValueError('top_k must be >= 1.')
+        self.top_k = top_k
+        self.min_margin = min_margin
+        self.keep_log = keep_log
+        # {邮箱: 序号}
+        self.__email_slots = {}
+        # 去重后的名字以及 {名字: 名字序号}
+        self.__names = []
+        self.__name_ids = {}
+        # 按邮箱序号排列的最优名字序号（-1 表示还没有名字）以及权重
+        self.__owner_name_ids = array.array('q')
+        self.__owner_weights = array.array('d')
+        # {邮箱序号: Owner}，只在记录候选名字时使用
         self.__owners_map = {}
+        # {邮箱: [(姓名位置, 名字, 权重（未计算代价）, 权重, 各阶段权重)]}
+        self.__logs = {}
+
+    @property
+    def track_candidates(self):
+        # 只保留一个名字、不检查权重差且不记录候选时不需要记录候选名字
+        return self.top_k > 1 or self.min_margin is not None or self.keep_log
+
+    def __get_slot(self, email):
+        slot = self.__email_slots.get(email, None)
+        if slot is None:
+            slot = self.__email_slots[email] = len(self.__owner_name_ids)
+            self.__owner_name_ids.append(-1)
+            self.__owner_weights.append(0)
+        return slot
+
+    def __intern_name(self, name):
+        name_id = self.__name_ids.get(name, None)
+        if name_id is None:
+            name_id = self.__name_ids[name] = len(self.__names)
+            self.__names.append(sys.intern(name))
+        return name_id
 
     def update(self, email, name=None, name_weight=None):
 
@@ -22,400 +129,2516 @@ class Storager(object):
         if name_weight is None:
             name_weight = 1
 
-        # 检查 email 是否已收录
-        owner = self.__owners_map.get(email, None)
-        if owner is not None:
-            # 存在则更新 owner 对象
-            owner.set_name(name=name, name_weight=name_weight)
-        else:
-            # 不存在则新增 owner 对象
-            owner = Owner()
-            owner.set_name(name=name, name_weight=name_weight)
-            self.__owners_map.setdefault(email, owner)
+        slot = self.__get_slot(email)
+        # 第一个名字直接记录，之后只有权重更高时才替换
+        if name is not None:
+            if self.__owner_name_ids[slot] < 0 or name_weight > self.__owner_weights[slot]:
+                self.__owner_name_ids[slot] = self.__intern_name(name)
+                self.__owner_weights[slot] = name_weight
+
+    def add_candidate(self, email, name, name_weight, stages=None, position=None, raw_weight=None):
+        """
+            记录一个超过阈值的候选名字，每个邮箱只保留权重最高的 top_k 个
+        :param position:    姓名在完整姓名列表中的位置（keep_log 时需要）
+        :param raw_weight:  未计算代价的权重（keep_log 时需要）
+        """
+        slot = self.__get_slot(email)
+        owner = self.__owners_map.get(slot, None)
+        if owner is None:
+            # 计算权重差至少需要保留两个候选名字
+            candidates_size = max(self.top_k, 2) if self.min_margin is not None else self.top_k
+            owner = self.__owners_map[slot] = Owner(candidates_size=candidates_size)
+        name = self.__names[self.__intern_name(name)]
+        owner.add_candidate(Candidate(name=name, weight=name_weight, stages=stages))
+        if self.keep_log:
+            self.__logs.setdefault(email, []).append((position, name, raw_weight, name_weight, stages))
+
+    def __replay(self, email, log):
+        # 按姓名位置重放候选记录，与单个进程按顺序匹配所有姓名的更新规则相同
+        best_weight = 0
+        normalized_names = set()
+        for position, name, raw_weight, name_weight, stages in sorted(log, key=lambda entry: entry[0]):
+            # 重复的邮箱会产生相同的记录，不同分片中规范化后相同的姓名只保留位置最前的一个
+            normalized_name = normalize_author(name)
+            if normalized_name in normalized_names:
+                continue
+            normalized_names.add(normalized_name)
+            if raw_weight > best_weight:
+                self.update(email=email, name=name, name_weight=name_weight)
+                best_weight = name_weight
+            self.add_candidate(email=email, name=name, name_weight=name_weight, stages=stages, position=position,
+                               raw_weight=raw_weight)
+
+    def dump(self, output_file):
+        """
+            以 JSONL 写出候选记录，每行为 {"email": 邮箱, "log": [[姓名位置, 名字, 权重（未计算代价）, 权重, 各阶段权重], ...]}
+        :param output_file: 文本文件对象
+        """
+        if not self.keep_log:
+            raise ValueError('Storager was created without keep_log.')
+        for email, log in self.__logs.items():
+            output_file.write(json.dumps({'email': email, 'log': log}, ensure_ascii=False) + '\n')
+
+    @classmethod
+    def merge(cls, storagers, top_k=1, min_margin=None):
+        """
+            合并匹配不同姓名分片（姓名位置互不重叠）得到的结果，与单个进程匹配所有姓名的结果相同
+        :param storagers:   keep_log 为真的 Storager 对象列表
+        :return:            新的 Storager 对象
+        """
+        logs = {}
+        for storager in storagers:
+            if not storager.keep_log:
+                raise ValueError('Storager was created without keep_log.')
+            for email, log in storager.__logs.items():
+                logs.setdefault(email, []).extend(log)
+        merged = cls(top_k=top_k, min_margin=min_margin, keep_log=True)
+        for email, log in logs.items():
+            merged.__replay(email, log)
+        return merged
+
+    @classmethod
+    def load(cls, input_files, top_k=1, min_margin=None):
+        """
+            读取 dump 写出的一个或多个分片并合并
+        :param input_files: 文本文件对象列表
+        :return:            新的 Storager 对象
+        """
+        logs = {}
+        for input_file in input_files:
+            for line in input_file:
+                line = line.strip()
+                if line:
+                    record = json.loads(line)
+                    logs.setdefault(record['email'], []).extend(tuple(entry) for entry in record['log'])
+        merged = cls(top_k=top_k, min_margin=min_margin, keep_log=True)
+        for email, log in logs.items():
+            merged.__replay(email, log)
+        return merged
+
+    def __margin(self, slot, name):
+        # 与次优候选的权重差，没有次优候选时为最优权重本身
+        weight = self.__owner_weights[slot]
+        owner = self.__owners_map.get(slot, None)
+        for candidate in owner.candidates if owner is not None else ():
+            if candidate.name != name:
+                return weight - candidate.weight
+        return weight
+
+    def get(self, email, default=None):
+        """
+            获取邮箱的最优名字，与 email_owners.get 相同
+        """
+        slot = self.__email_slots.get(email, None)
+        if slot is None or self.__owner_name_ids[slot] < 0:
+            return default
+        name = self.__names[self.__owner_name_ids[slot]]
+        if self.min_margin is not None and self.__margin(slot, name) < self.min_margin:
+            return default
+        return name
+
+    def iter_email_owners(self):
+        """
+            逐个产出 (邮箱, 名字)，内容和顺序与 email_owners 相同，不复制整个结果
+        """
+        names = self.__names
+        owner_name_ids = self.__owner_name_ids
+        for email, slot in self.__email_slots.items():
+            name_id = owner_name_ids[slot]
+            if name_id < 0:
+                # 与原来的 Owner 相同，没有名字的邮箱结果为 None
+                yield email, None
+                continue
+            name = names[name_id]
+            if self.min_margin is None or self.__margin(slot, name) >= self.min_margin:
+                yield email, name
 
     @property
     def email_owners(self):
-        email_owners = {
-            email: owner.name
-            for email, owner in self.__owners_map.items()
-        }
+        email_owners = dict(self.iter_email_owners())
         return email_owners
 
+    @property
+    def email_candidates(self):
+        email_candidates = {
+            email: self.__owners_map[slot].candidates[:self.top_k] if slot in self.__owners_map else []
+            for email, slot in self.__email_slots.items()
+        }
+        return email_candidates
+
+    def __len__(self):
+        return len(self.__email_slots)
+
 
 class Owner(object):
     """
-        用于存储权重的数据结构
+        用于存储每个邮箱候选名字的数据结构
     """
 
-    def __init__(self):
-        self.__name = None
-        self.__name_weight = 0
+    __slots__ = ('__candidates_size', '__candidates_heap', '__candidates_count')
+
+    def __init__(self, candidates_size=1):
+        # 最小堆，元素为 (权重, -序号, 候选名字)，权重相同时先出现的名字优先
+        self.__candidates_size = candidates_size
+        self.__candidates_heap = []
+        self.__candidates_count = 0
+
+    def add_candidate(self, candidate):
+        self.__candidates_count += 1
+        item = (candidate.weight, -self.__candidates_count, candidate)
+        # 重复的名字只保留权重最高的一个
+        for index, existing in enumerate(self.__candidates_heap):
+            if existing[2].name == candidate.name:
+                if candidate.weight > existing[0]:
+                    self.__candidates_heap[index] = item
+                    heapq.heapify(self.__candidates_heap)
+                return
+        if len(self.__candidates_heap) < self.__candidates_size:
+            heapq.heappush(self.__candidates_heap, item)
+        elif item[:2] > self.__candidates_heap[0][:2]:
+            heapq.heapreplace(self.__candidates_heap, item)
 
-    def set_name(self, name, name_weight):
-        if name is not None:
-            if self.__name is None:
-                self.__name = name
-            elif self.__name is not None and name_weight > self.__name_weight:
-                self.__name = name
-                self.__name_weight = name_weight
+    @property
+    def candidates(self):
+        return [
+            item[2] for item in sorted(self.__candidates_heap, key=lambda item: item[:2], reverse=True)
+        ]
+
+
+def _decode_html_entity(match):
+    entity = match.group(1)
+    if entity.startswith('#'):
+        return html.unescape(match.group(0) if match.group(0).endswith(';') else match.group(0) + ';')
+    # 实体名区分大小写，依次尝试原样、首字母大写（全部大写的名字中）以及小写
+    for entity_name in (entity, entity.capitalize(), entity.lower()):
+        char = html.entities.html5.get(entity_name + ';')
+        if char is not None:
+            return char
+    return match.group(0)
+
+
+class _TransliterationTable(dict):
+    """
+        str.translate 使用的转写表，第一次遇到某个字符时才计算该字符 NFKD 分解后的 ASCII 部分
+        NFKD 只分解单个字符并调整组合音调的顺序，音调都不是 ASCII 字符，因此逐个字符转写与整体转写结果相同
+    """
+
+    def __missing__(self, codepoint):
+        # 空字符串表示删除该字符
+        transliterated = unicodedata.normalize('NFKD', chr(codepoint)).encode('ascii', 'ignore').decode()
+        self[codepoint] = transliterated
+        return transliterated
+
+
+_TRANSLITERATION_TABLE = _TransliterationTable()
+
+
+@functools.lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def normalize_author(author):
+    """
+        规范化姓名：解码 HTML 实体并去除小语种音调，同一进程内重复出现的姓名只处理一次
+        e.g. PAZ MAR&IACUTE -> PAZ MARI
+             Rogério Silva Santos -> Rogerio Silva Santos
+    :param author:  原始姓名
+    :return:        规范化后的姓名
+    """
+    if '&' in author:
+        author = HTML_ENTITY_REGEX.sub(_decode_html_entity, author)
+    if not author.isascii():
+        author = author.translate(_TRANSLITERATION_TABLE)
+    return author
+
+
+class AuthorProfile(object):
+    """
+        预编译的姓名特征，每个姓名只构造一次，供所有邮箱复用
+    """
+
+    def __init__(self, author):
+        # 暂时保存原始姓名
+        self.original_name = author
+
+        # 解码 HTML 实体并去除小语种音调，特征都由规范化后的姓名构造
+        self.name = normalize_author(author)
+
+        # 将名字切割为单词构造名字单词列表
+        author_words_list = NON_WORD_CHARACTER_REGEX.split(self.name)
+        self.words_list = author_words_list
+
+        # = = = = = 全名以及全名截断（连续字母） = = = = =
+
+        # 除去单字符单词，构造名字特征列表以及对应的正则
+        author_feature_list = [
+            author_words for author_words in author_words_list if len(author_words) > 1
+        ]
+        # 对名字单词进行截断（最小长度4位）
+        upper_limit = max(list(map(lambda w: len(w), author_words_list)))
+        lower_limit = 4
+        for limit in range(upper_limit, lower_limit - 1, -1):
+            for author_words in author_words_list:
+                if len(author_words) >= limit:
+                    author_words_top_n_char = author_words[0:limit]
+                    if author_words_top_n_char not in author_feature_list:
+                        author_feature_list.append(author_words_top_n_char)
+        self.feature_list = author_feature_list
+
+        # = = = = = 全名以及全名截断的倒序情况（连续字母） = = = = =
+
+        # 倒序特征以及所有正则在 __derive 中构造
+
+        # = = = = = 名字每个词前n字母组合 = = = = =
+
+        # 取出所有单词的前 2～3 个字母，每个单词对应一行
+        author_feature_shout_same_limit_matrix = [[] for _ in author_words_list]
+        for limit in [3, 2]:
+            for index, author_words in enumerate(author_words_list):
+                if len(author_words) >= limit:
+                    author_words_top_n_char = author_words[0:limit]
+                    if author_words_top_n_char not in author_feature_list:
+                        author_feature_shout_same_limit_matrix[index].append(author_words_top_n_char)
+
+        # 清除空行
+        self.feature_shout_table = [
+            row for row in author_feature_shout_same_limit_matrix if len(row) != 0
+        ]
+        # 按片段前两个字母索引 (行序号, 小写片段)，匹配时直接查表，无需枚举所有组合
+        self.feature_shout_index = {}
+        for row_index, row in enumerate(self.feature_shout_table):
+            for author_feature_shout in row:
+                folded_feature_shout = _fold_feature(author_feature_shout)
+                if folded_feature_shout is None:
+                    continue
+                self.feature_shout_index.setdefault(folded_feature_shout[0:2], []).append(
+                    (row_index, folded_feature_shout)
+                )
+
+        # = = = = = 姓名首字母 = = = = =
+
+        # 获取单词首字母，构造名字首字母列表
+        self.first_char_list = [
+            author_words[0] for author_words in author_words_list
+            if len(author_words) > 0  # 避免出现空字符串的情况
+        ]
+
+        # = = = = = 剪枝用的字母集合 = = = = =
+
+        # 所有特征都由单词字母构成，忽略大小写后的字母集合
+        self.alphabet = set(
+            folded_char for folded_char in map(_fold_character, ''.join(author_words_list)) if folded_char is not None
+        )
+        # 忽略大小写后的连续首字母，存在无法匹配的字符时为 None
+        self.first_char_folded = _fold_feature(''.join(self.first_char_list))
+        # 忽略大小写后的首字母集合
+        self.first_char_alphabet = set(
+            folded_char for folded_char in map(_fold_character, self.first_char_list) if folded_char is not None
+        )
+        # 单词的前两个字母及其倒序，全名截断、倒序以及片段组合的所有特征都包含其中之一
+        self.feature_bigrams = set()
+        for author_words in author_words_list:
+            bigram = _fold_feature(author_words[0:2]) if len(author_words) >= 2 else None
+            if bigram is not None:
+                self.feature_bigrams.add(bigram)
+                self.feature_bigrams.add(bigram[::-1])
+
+        self.__derive()
+
+    def __derive(self):
+        # 由已构造的特征推导出的其余属性，从索引文件恢复时同样需要
+
+        # 名字单词量
+        self.words_count = len(self.words_list)
+
+        self.feature_regex_str = '|'.join(self.feature_list)
+        self.feature_reverse_list = [
+            author_feature[::-1] for author_feature in self.feature_list
+        ]
+        self.feature_reverse_regex_str = '|'.join(self.feature_reverse_list)
+        # 连续首字母
+        self.first_char_con_regex_str = ''.join(self.first_char_list)
+        # 不连续首字母
+        self.first_char_regex_str = '|'.join(self.first_char_list)
+
+        # 按匹配阶段索引特征列表（列表顺序即正则分支的优先级）
+        self.stage_features = {
+            STAGE_FEATURE: self.feature_list,
+            STAGE_FEATURE_REVERSE: self.feature_reverse_list,
+        }
+        # 正则编译占构造特征的大部分时间，只在第一次使用时编译
+        self.__regexes = {}
+        self.__folded_stage_features = None
+
+        # 连续首字母的开头（首字母只有一个时为该字母），连续首字母出现在用户名中时必然包含
+        self.first_char_key = self.first_char_folded[0:2] if self.first_char_folded else None
+
+        # = = = = = 代价因子 = = = = =
+
+        # 名字越短，需要确定的信息越少，代价越小
+        # 代价函数 1 - abs(1 - (1 / (x - 1) ^ 0.5)) 在变量域 [2, +∞)里，值域为 [0, 1)
+        # 单个单词的名字不在变量域内，不进行代价计算
+        if self.words_count >= 2:
+            self.cost_factor = 1 - abs(1 - (1 / (self.words_count - 1) ** 0.5))
+        else:
+            self.cost_factor = None
+
+    @property
+    def folded_stage_features(self):
+        """
+            忽略大小写后的全名截断以及倒序特征 {匹配阶段: [小写特征或 None]}，与 stage_features 一一对应，第一次使用时计算
+        """
+        if self.__folded_stage_features is None:
+            self.__folded_stage_features = {
+                stage: [_fold_feature(feature) for feature in feature_list]
+                for stage, feature_list in self.stage_features.items()
+            }
+        return self.__folded_stage_features
+
+    def __regex(self, regex_str):
+        regex = self.__regexes.get(regex_str)
+        if regex is None:
+            regex = self.__regexes[regex_str] = re.compile(regex_str, re.IGNORECASE)
+        return regex
+
+    @property
+    def feature_regex(self):
+        return self.__regex(self.feature_regex_str)
 
     @property
-    def name(self):
-        return self.__name
+    def feature_reverse_regex(self):
+        return self.__regex(self.feature_reverse_regex_str)
 
+    @property
+    def first_char_con_regex(self):
+        return self.__regex(self.first_char_con_regex_str)
 
-def correlation(email_list: list, author_list: list, keep_original=False, debug=False):
+    @property
+    def first_char_regex(self):
+        return self.__regex(self.first_char_regex_str)
+
+    def stage_regex(self, stage):
+        return self.__regex(self.feature_regex_str if stage == STAGE_FEATURE else self.feature_reverse_regex_str)
+
+    def search_first_char_con(self, text):
+        """
+            查找连续首字母，等价于 first_char_con_regex.search(text)
+        :return:    匹配到的内容，没有匹配时返回 None
+        """
+        # 纯字母用户名直接按忽略大小写后的首字母查找，无需编译正则
+        if self.first_char_list and text.isascii() and text.isalpha():
+            if self.first_char_folded is None:
+                return None
+            position = text.lower().find(self.first_char_folded)
+            return text[position:position + len(self.first_char_folded)] if position >= 0 else None
+        match = self.first_char_con_regex.search(text)
+        return match.group() if match is not None else None
+
+    def findall_first_char(self, text):
+        """
+            查找所有首字母，等价于 first_char_regex.findall(text)
+        """
+        if self.first_char_list and text.isascii() and text.isalpha():
+            first_char_alphabet = self.first_char_alphabet
+            return [char for char in text if char.lower() in first_char_alphabet]
+        return self.first_char_regex.findall(text)
+
+    def to_record(self):
+        """
+            转换为可以 JSON 序列化的字典，用于写入索引文件
+        """
+        return {
+            'original_name': self.original_name,
+            'name': self.name,
+            'words_list': self.words_list,
+            'feature_list': self.feature_list,
+            'feature_shout_table': self.feature_shout_table,
+            'feature_shout_index': self.feature_shout_index,
+            'first_char_list': self.first_char_list,
+            'alphabet': sorted(self.alphabet),
+            'first_char_folded': self.first_char_folded,
+            'first_char_alphabet': sorted(self.first_char_alphabet),
+            'feature_bigrams': sorted(self.feature_bigrams),
+        }
+
+    @classmethod
+    def from_record(cls, record):
+        """
+            从 to_record 的结果恢复，不重新构造特征
+        """
+        profile = cls.__new__(cls)
+        profile.original_name = record['original_name']
+        profile.name = record['name']
+        profile.words_list = record['words_list']
+        profile.feature_list = record['feature_list']
+        profile.feature_shout_table = record['feature_shout_table']
+        profile.feature_shout_index = {
+            bigram: [tuple(item) for item in items] for bigram, items in record['feature_shout_index'].items()
+        }
+        profile.first_char_list = record['first_char_list']
+        profile.alphabet = set(record['alphabet'])
+        profile.first_char_folded = record['first_char_folded']
+        profile.first_char_alphabet = set(record['first_char_alphabet'])
+        profile.feature_bigrams = set(record['feature_bigrams'])
+        profile.__derive()
+        return profile
+
+
+class _FragmentSearchLimit(Exception):
+    pass
+
+
+def find_fragment_sequences(text, fragments_at, stats=None):
     """
-        匹配邮箱对应的名字
-    :param email_list:  邮箱列表
-    :param author_list: 姓名列表
-    :param debug:       是否打印调试
-    :return:            匹配邮箱对应名字结果
+        从左到右查找由名字片段组成的最长组合（至少两个片段，每个单词最多使用一次，顺序任意）
+        等价于按长度降序排列所有片段排列组合构造的正则，但不生成任何组合字符串；
+        在文本中命中位置完全相同的单词可以互相替换，搜索时只记录每组单词已经使用的数量，
+        命中位置相同的单词很多时状态数量与单词数量成多项式关系（例如多个前缀相同的单词）；
+        命中位置各不相同的单词很多时状态数量仍会指数增长，因此超过 MAX_FRAGMENT_SEARCH_STATES 时停止搜索，
+        只返回之前的位置已经找到的组合（与完整搜索结果的前一部分相同）
+    :param text:            待匹配文本
+    :param fragments_at:    函数，返回从某个位置开始能匹配到的 (行序号, 片段长度) 列表
+    :param stats:           CorrelationStats 对象，记录超过状态数量上限的次数
+    :return:                匹配到的内容列表
     """
 
-    # 检查参数
-    email_list = [
-        email for email in email_list if '@' in email
-    ]
-    author_list = [
-        author for author in author_list if author.strip() != ''
+    # 每个位置能匹配到的 (行序号, 片段长度)，以及每一行的全部命中
+    position_fragments = [fragments_at(position) for position in range(len(text))]
+    row_hits = {}
+    for position, fragments in enumerate(position_fragments):
+        for row_index, length in fragments:
+            row_hits.setdefault(row_index, []).append((position, length))
+    if len(row_hits) < 2:
+        return []
+
+    # 按命中分组，每一行对应 (所在分组的进位基数, 分组的行数)，各组已使用的数量编码为一个混合进制整数
+    row_groups = {}
+    for row_index, hits in row_hits.items():
+        row_groups.setdefault(tuple(sorted(hits)), []).append(row_index)
+    row_slots = {}
+    radix = 1
+    for rows in row_groups.values():
+        for row_index in rows:
+            row_slots[row_index] = (radix, len(rows))
+        radix *= len(rows) + 1
+    # 同一组的行在同一位置的片段相同，只需要尝试一次
+    position_fragments = [
+        list(dict.fromkeys((row_slots[row_index], length) for row_index, length in fragments))
+        for fragments in position_fragments
     ]
+    text_length = len(text)
+    longest_cache = {}
+
+    def longest(position, used, enough):
+        # 从 position 开始还能继续匹配的最长长度，片段数量不足两个时返回 -1
+        key = (position, used, enough)
+        if key in longest_cache:
+            return longest_cache[key]
+        if len(longest_cache) >= MAX_FRAGMENT_SEARCH_STATES:
+            raise _FragmentSearchLimit()
+        best_length = 0 if enough else -1
+        if position < text_length:
+            for (radix, capacity), length in position_fragments[position]:
+                # 该组的单词已经全部使用
+                if used // radix % (capacity + 1) == capacity:
+                    continue
+                rest_length = longest(position + length, used + radix, enough or used != 0)
+                if rest_length >= 0 and length + rest_length > best_length:
+                    best_length = length + rest_length
+        longest_cache[key] = best_length
+        return best_length
+
+    match_result = []
+    position = 0
+    try:
+        while position < text_length:
+            length = longest(position, 0, False)
+            if length > 0:
+                match_result.append(text[position:position + length])
+                position += length
+            else:
+                position += 1
+    except _FragmentSearchLimit:
+        if stats is not None:
+            stats.pairs_fragment_capped += 1
+    return match_result
+
+
+# 姓名特征缓存的统计，与 functools.lru_cache 的 cache_info 相同
+ProfileCacheInfo = collections.namedtuple('ProfileCacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class _ProfileCache(object):
+    """
+        姓名特征缓存（LRU），调用方式以及 cache_info、cache_clear 与 functools.lru_cache 相同
+        每次匹配前按姓名数量调整容量（不小于默认容量），同一份姓名列表重复出现时，
+        即使姓名数量超过默认容量也不会在一次调用中把自己挤出缓存
+    """
+
+    def __init__(self, maxsize):
+        self.default_maxsize = maxsize
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.__profiles = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __call__(self, author):
+        """
+            获取姓名特征，同一进程内重复出现的姓名只构造一次
+        :param author:  姓名
+        :return:        AuthorProfile 对象
+        """
+        with self.__lock:
+            profile = self.__profiles.get(author)
+            if profile is not None:
+                self.hits += 1
+                self.__profiles.move_to_end(author)
+                return profile
+            self.misses += 1
+        profile = AuthorProfile(author)
+        with self.__lock:
+            self.__profiles[author] = profile
+            self.__evict()
+        return profile
+
+    def fit(self, size):
+        """
+            按本次调用的姓名数量调整容量，容量不小于默认容量
+        :param size:    姓名数量
+        """
+        with self.__lock:
+            self.maxsize = max(self.default_maxsize, size)
+            self.__evict()
+
+    def __evict(self):
+        while len(self.__profiles) > self.maxsize:
+            self.__profiles.popitem(last=False)
+
+    def cache_info(self):
+        with self.__lock:
+            return ProfileCacheInfo(self.hits, self.misses, self.maxsize, len(self.__profiles))
+
+    def cache_clear(self):
+        with self.__lock:
+            self.__profiles.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# 获取姓名特征：get_author_profile(姓名) -> AuthorProfile
+get_author_profile = _ProfileCache(PROFILE_CACHE_SIZE)
+
+
+def _author_list_digest(author_list):
+    return hashlib.sha256('\0'.join(author_list).encode('utf-8')).digest()
+
+
+class ProfileIndexError(ValueError):
+    """
+        姓名特征索引文件无效或已过期
+    """
+
 
-    storager = Storager()
-    for email in email_list:
-        # 取邮箱姓名部分并去符号
-        email_user = email.split('@')[0]
-        email_user = NON_ALPHABET_CHARACTER_REGEX.subn('', email_user)[0]
+class ProfileIndex(object):
+    """
+        预先构造并保存在文件中的姓名特征，通过 mmap 只读打开
+        同一台机器上的所有工作进程共享文件页，只在第一次使用某个姓名时解析对应记录，无需重新构造特征
+        文件结构：文件头 | 姓名列表（JSON） | 每条记录的偏移量 | 每个姓名的特征记录（JSON）
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as index_file:
+            try:
+                self.__buffer = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # 空文件无法 mmap
+                raise ProfileIndexError('%s is not a profile index.' % path)
+        try:
+            self.__load()
+        except ProfileIndexError:
+            self.__buffer.close()
+            raise
+
+    def __load(self):
+        # 检查文件头、姓名列表以及偏移量表，文件被截断或损坏时抛出 ProfileIndexError
+        path = self.path
+        buffer_size = len(self.__buffer)
+        if buffer_size < PROFILE_INDEX_HEADER.size:
+            raise ProfileIndexError('%s is not a profile index.' % path)
+        magic, version, digest, records_digest, count, names_size = PROFILE_INDEX_HEADER.unpack_from(self.__buffer, 0)
+        if magic != PROFILE_INDEX_MAGIC:
+            raise ProfileIndexError('%s is not a profile index.' % path)
+        if version != FEATURE_RULES_VERSION:
+            raise ProfileIndexError('%s was built with feature rules version %d, expected %d.' % (
+                path, version, FEATURE_RULES_VERSION
+            ))
+        names_offset = PROFILE_INDEX_HEADER.size
+        offsets_offset = names_offset + names_size
+        records_offset = offsets_offset + (count + 1) * PROFILE_INDEX_OFFSET.size
+        if records_offset > buffer_size:
+            raise ProfileIndexError('%s is truncated.' % path)
+        try:
+            authors = json.loads(self.__buffer[names_offset:offsets_offset].decode('utf-8'))
+        except ValueError:
+            raise ProfileIndexError('%s has a corrupt author list.' % path)
+        if not isinstance(authors, list) or len(authors) != count:
+            raise ProfileIndexError('%s has a corrupt author list.' % path)
+        # 偏移量从 0 开始单调不减，最后一个偏移量即所有记录的总长度
+        offsets = struct.unpack_from('<%dQ' % (count + 1), self.__buffer, offsets_offset)
+        if offsets[0] != 0 or any(start > end for start, end in zip(offsets, offsets[1:])):
+            raise ProfileIndexError('%s has corrupt record offsets.' % path)
+        records_size = offsets[-1]
+        if records_offset + records_size > buffer_size:
+            raise ProfileIndexError('%s is truncated.' % path)
+        # 校验偏移量表与记录，记录中任何一个字节被修改都会重新构造
+        with memoryview(self.__buffer) as buffer_view:
+            with buffer_view[offsets_offset:records_offset + records_size] as records_view:
+                if hashlib.sha256(records_view).digest() != records_digest:
+                    raise ProfileIndexError('%s has corrupt records.' % path)
+
+        self.digest = digest
+        self.authors = authors
+        self.__positions = {author: position for position, author in enumerate(authors)}
+        self.__offsets_offset = offsets_offset
+        self.__records_offset = records_offset
+        self.__profiles = {}
+
+    @classmethod
+    def build(cls, path, author_list):
+        """
+            构造索引文件，先写入临时文件再替换，正在读取旧文件的进程不受影响
+        :param path:        索引文件路径
+        :param author_list: 姓名列表
+        :return:            ProfileIndex 对象
+        """
+        authors = list(dict.fromkeys(author for author in author_list if author.strip() != ''))
+        names = json.dumps(authors, ensure_ascii=False).encode('utf-8')
+        get_author_profile.fit(len(authors))
+        records = [
+            json.dumps(get_author_profile(author).to_record(), ensure_ascii=False).encode('utf-8')
+            for author in authors
+        ]
+        offsets = [0]
+        for record in records:
+            offsets.append(offsets[-1] + len(record))
+        offsets_data = b''.join(PROFILE_INDEX_OFFSET.pack(offset) for offset in offsets)
+        records_digest = hashlib.sha256(offsets_data)
+        for record in records:
+            records_digest.update(record)
+
+        temporary_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(temporary_path, 'wb') as index_file:
+            index_file.write(PROFILE_INDEX_HEADER.pack(PROFILE_INDEX_MAGIC, FEATURE_RULES_VERSION,
+                                                       _author_list_digest(authors), records_digest.digest(),
+                                                       len(authors), len(names)))
+            index_file.write(names)
+            index_file.write(offsets_data)
+            for record in records:
+                index_file.write(record)
+        os.replace(temporary_path, path)
+        return cls(path)
+
+    @classmethod
+    def open_or_build(cls, path, author_list):
+        """
+            打开索引文件，文件不存在、规则版本不同或姓名列表不同时重新构造
+        """
+        authors = list(dict.fromkeys(author for author in author_list if author.strip() != ''))
+        try:
+            index = cls(path)
+        except (OSError, ProfileIndexError):
+            return cls.build(path, authors)
+        if index.digest != _author_list_digest(authors):
+            index.close()
+            return cls.build(path, authors)
+        return index
+
+    def get(self, author):
+        """
+            获取姓名特征，姓名不在索引中时返回 None，记录无法解析时抛出 ProfileIndexError
+        """
+        position = self.__positions.get(author)
+        if position is None:
+            return None
+        profile = self.__profiles.get(position)
+        if profile is None:
+            start, end = struct.unpack_from('<2Q', self.__buffer,
+                                            self.__offsets_offset + position * PROFILE_INDEX_OFFSET.size)
+            record = self.__buffer[self.__records_offset + start:self.__records_offset + end]
+            try:
+                profile = AuthorProfile.from_record(json.loads(record.decode('utf-8')))
+            except (ValueError, TypeError, KeyError, re.error):
+                raise ProfileIndexError('%s has a corrupt record for %r.' % (self.path, author))
+            self.__profiles[position] = profile
+        return profile
+
+    def close(self):
+        self.__buffer.close()
+
+    def __contains__(self, author):
+        return author in self.__positions
+
+    def __len__(self):
+        return len(self.authors)
+
+    def __reduce__(self):
+        # 传递给工作进程时只传递路径，在工作进程中重新打开
+        return _open_profile_index, (self.path,)
+
+    def __repr__(self):
+        return '%s(%r, authors=%d)' % (self.__class__.__name__, self.path, len(self))
+
+
+# 工作进程中已打开的索引文件
+_opened_profile_indexes = {}
+
+
+def _open_profile_index(path):
+    # 文件被重新构造后重新打开，并关闭同一路径下已被替换的旧文件
+    stat = os.stat(path)
+    key = (path, stat.st_ino, stat.st_mtime_ns)
+    index = _opened_profile_indexes.get(key)
+    if index is None:
+        for opened_key in [opened_key for opened_key in _opened_profile_indexes if opened_key[0] == path]:
+            _opened_profile_indexes.pop(opened_key).close()
+        index = _opened_profile_indexes[key] = ProfileIndex(path)
+    return index
+
+
+class RegexEngine(object):
+    """
+        逐个姓名运行预编译正则的匹配引擎（片段组合阶段直接查询片段索引）
+    """
 
-        best_author_feature_weight = 0
-        for author in author_list:
+    def __init__(self, profiles):
+        self.profiles = profiles
 
-            # 标记 TOP 3 算法是否有匹配结果
-            correlation_1_done = False
-            correlation_2_done = False
-            correlation_3_done = False
+    def scan(self, email_user):
+        pass
 
-            # 暂时保存原始姓名
-            original_author_name = author
+    def candidates(self, email_user):
+        """
+            逐个姓名运行正则，扫描不产生候选姓名，返回 None（由 CandidateIndex 筛选或计算所有姓名）
+        """
+        return None
 
-            # 初始化但前权重
-            current_author_weight = 0
+    def findall(self, profile, stage, text, stats=None):
+        if stage == STAGE_FEATURE_SHOUT:
+            text_lower = text.lower()
+            feature_shout_index = profile.feature_shout_index
 
-            # 复制邮箱姓名部分副本
-            email_user_copy = ''.join(email_user)
+            def fragments_at(position):
+                return [
+                    (row_index, len(folded_feature_shout))
+                    for row_index, folded_feature_shout in feature_shout_index.get(text_lower[position:position + 2], ())
+                    if text_lower.startswith(folded_feature_shout, position)
+                ]
 
-            # 暂时保存将名字切割为单词构造名字单词列表
-            author_words_list_after_non_word_character_split = NON_WORD_CHARACTER_REGEX.split(author)
-            # 名字单词量
-            author_words_count = len(author_words_list_after_non_word_character_split)
+            return find_fragment_sequences(text, fragments_at, stats=stats)
+        return profile.stage_regex(stage).findall(text)
 
-            # = = = = = 匹配全名以及全名截断（连续字母） = = = = =
 
-            # 去除小语种音调
-            author = unicodedata.normalize('NFKD', author).encode('ascii', 'ignore').decode()
-            # 将名字切割为单词构造名字单词列表
-            author_words_list = author_words_list_after_non_word_character_split.copy()
+# 字符在忽略大小写时能够匹配的 ASCII 小写字母（与 re.IGNORECASE 的规则一致）
+_FOLD_CHARACTER_CACHE = {}
 
-            # 除去单字符单词，构造名字特征列表以及对应的正则
-            author_feature_list = [
-                author_words for author_words in author_words_list if len(author_words) > 1
-            ]
-            # 对名字单词进行截断（最小长度4位）
-            upper_limit = max(list(map(lambda w: len(w), author_words_list)))
-            lower_limit = 4
-            for limit in range(upper_limit, lower_limit - 1, -1):
-                for author_words in author_words_list:
-                    if len(author_words) >= limit:
-                        author_words_top_n_char = author_words[0:limit]
-                        if author_words_top_n_char not in author_feature_list:
-                            author_feature_list.append(author_words_top_n_char)
-            author_feature_regex_str = '|'.join(author_feature_list)
-            # 匹配名字单词特征
-            author_feature_match_result = re.findall(author_feature_regex_str, email_user_copy, re.IGNORECASE)
-            # 获取权重（按字母数计算）
-            current_author_feature_weight = sum([
-                len(author_feature) for author_feature in author_feature_match_result
-            ])
-            # 名字单词字母连续，应强化权重
-            current_author_feature_weight = 1.2 * current_author_feature_weight
-            current_author_weight += current_author_feature_weight
-
-            # 有结果时标记
-            if current_author_feature_weight != 0:
-                correlation_1_done = True
-
-            # - - - - - 打印调试日志 - - - - -
-            if debug:
-                print('= ' * 20)
-                print('Name: ', author)
-                print('Email:', email)
-                print('User Part:', email_user_copy)
-                print(author_feature_list)
-                print(author_feature_regex_str)
-                print(author_feature_match_result)
-                print(current_author_feature_weight)
-            # - - - - - 打印调试日志 - - - - -
-
-            # 删除匹配到的内容，避免重复匹配
-            for author_feature in author_feature_match_result:
-                email_user_copy = email_user_copy.replace(author_feature, '')
-
-            # = = = = = 匹配全名以及全名截断的倒序情况（连续字母） = = = = =
-
-            # 对所有名字单词截断进行反转
-            # 目的是为了识别故意将名字部分倒转的情况
-            #  e.g. Name:  Kazuhiro Yoneda
-            #       Email: dradenoy@ybb.ne.jp
-
-            author_feature_reverse_list = [
-                author_feature[::-1] for author_feature in author_feature_list
-            ]
-            author_feature_reverse_regex_str = '|'.join(author_feature_reverse_list)
-            # 匹配名字单词特征
-            author_feature_reverse_match_result = re.findall(author_feature_reverse_regex_str, email_user_copy,
-                                                             re.IGNORECASE)
-            # 获取权重（按字母数计算）
-            current_author_feature_reverse_weight = sum([
-                len(author_feature_reverse) for author_feature_reverse in author_feature_reverse_match_result
-            ])
-            # 名字单词字母连续，应强化权重
-            current_author_feature_reverse_weight = 1.2 * current_author_feature_reverse_weight
-            current_author_weight += current_author_feature_reverse_weight
-
-            # 有结果时标记
-            if current_author_feature_reverse_weight != 0:
-                correlation_2_done = True
-
-            # - - - - - 打印调试日志 - - - - -
-            if debug:
-                print('- ' * 20)
-                print('Name: ', author)
-                print('Email:', email)
-                print('User Part:', email_user_copy)
-                print(author_feature_reverse_list)
-                print(author_feature_reverse_regex_str)
-                print(author_feature_reverse_match_result)
-                print(current_author_feature_reverse_weight)
-            # - - - - - 打印调试日志 - - - - -
-
-            # 删除匹配到的内容，避免重复匹配
-            for author_feature_reverse in author_feature_reverse_match_result:
-                email_user_copy = email_user_copy.replace(author_feature_reverse, '')
-
-            # # = = = = = 匹配名字每个词前n字母组合（n小段连续字母，每段都由单词的前 2～3 个字母组成） = = = = =
-
-            #  e.g. Name:  Yasuhiro KAWAI
-            #       Email: kaya@nih.go.jp
-
-            # 取出所有单词的前 2～3 个字母
-            author_feature_shout_same_limit_matrix = [[] for _ in author_words_list]
-            author_feature_shout_list = []
-            for limit in [3, 2]:
-                # author_feature_shout_same_limit = []
-                for index, author_words in enumerate(author_words_list):
-                    if len(author_words) >= limit:
-                        author_words_top_n_char = author_words[0:limit]
-                        if author_words_top_n_char not in author_feature_list:
-                            # author_feature_shout_same_limit.append(author_words_top_n_char)
-                            author_feature_shout_same_limit_matrix[index].append(author_words_top_n_char)
-
-            # 清除空行，避免影响递归
-            author_feature_shout_same_limit_matrix = [
-                row for row in author_feature_shout_same_limit_matrix if len(row) != 0
+
+def _fold_character(char):
+    folded = _FOLD_CHARACTER_CACHE.get(char, '')
+    if folded != '':
+        return folded
+    folded = None
+    char_regex = re.compile(re.escape(char), re.IGNORECASE)
+    for letter in 'abcdefghijklmnopqrstuvwxyz':
+        if char_regex.fullmatch(letter) or char_regex.fullmatch(letter.upper()):
+            folded = letter
+            break
+    _FOLD_CHARACTER_CACHE[char] = folded
+    return folded
+
+
+def _fold_feature(feature):
+    """
+        将特征转换为小写 ASCII 形式，无法匹配纯字母用户名时返回 None
+    """
+    folded_chars = [_fold_character(char) for char in feature]
+    if None in folded_chars:
+        return None
+    return ''.join(folded_chars)
+
+
+class _AhoCorasickAutomaton(object):
+    """
+        整批姓名的全名截断、倒序以及片段组合特征构造的 Aho-Corasick 自动机，以及筛选候选姓名用的集合
+        构造后只读，可以在多次调用以及多个线程之间共享
+    """
+
+    def __init__(self, profiles):
+        # 自动机状态：转移表、失败指针、输出指针以及每个状态对应的模式
+        self.__goto = [{}]
+        self.__fail = [0]
+        self.__output_link = [0]
+        self.__state_pattern = [None]
+        # 模式长度以及模式按姓名序号归类的标记 {姓名序号: [(匹配阶段, 优先级)]}，片段组合阶段的优先级为片段所在行序号
+        self.__pattern_lengths = []
+        self.__pattern_profile_tags = []
+
+        patterns = {}
+
+        def add_feature(folded_feature, index, stage, priority):
+            pattern_id = patterns.get(folded_feature)
+            if pattern_id is None:
+                pattern_id = self.__add_pattern(folded_feature)
+                patterns[folded_feature] = pattern_id
+            self.__pattern_profile_tags[pattern_id].setdefault(index, []).append((stage, priority))
+
+        for index, profile in enumerate(profiles):
+            for stage, folded_feature_list in profile.folded_stage_features.items():
+                for priority, folded_feature in enumerate(folded_feature_list):
+                    # 空特征以及无法匹配的特征不参与构造
+                    if not folded_feature:
+                        continue
+                    add_feature(folded_feature, index, stage, priority)
+            for row_list in profile.feature_shout_index.values():
+                for row_index, folded_feature_shout in row_list:
+                    add_feature(folded_feature_shout, index, STAGE_FEATURE_SHOUT, row_index)
+        self.__build_fail()
+
+        # 命中过的模式对应的姓名 {模式: (全名截断或倒序特征的姓名, 片段的姓名, 该片段对应多行的姓名)}，第一次命中时计算
+        self.__pattern_profiles = {}
+        # 只通过首字母阶段可能超过阈值的姓名
+        self.__initials_index = CandidateIndex(profiles, features=False)
+
+    def __add_pattern(self, pattern):
+        state = 0
+        for char in pattern:
+            next_state = self.__goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.__goto)
+                self.__goto.append({})
+                self.__fail.append(0)
+                self.__output_link.append(0)
+                self.__state_pattern.append(None)
+                self.__goto[state][char] = next_state
+            state = next_state
+        pattern_id = len(self.__pattern_lengths)
+        self.__pattern_lengths.append(len(pattern))
+        self.__pattern_profile_tags.append({})
+        self.__state_pattern[state] = pattern_id
+        return pattern_id
+
+    def __build_fail(self):
+        # 广度优先计算失败指针以及输出指针
+        queue = list(self.__goto[0].values())
+        for state in queue:
+            for char, next_state in self.__goto[state].items():
+                queue.append(next_state)
+                fail_state = self.__fail[state]
+                while fail_state and char not in self.__goto[fail_state]:
+                    fail_state = self.__fail[fail_state]
+                fail_state = self.__goto[fail_state].get(char, 0)
+                self.__fail[next_state] = fail_state
+                if self.__state_pattern[fail_state] is not None:
+                    self.__output_link[next_state] = fail_state
+                else:
+                    self.__output_link[next_state] = self.__output_link[fail_state]
+
+    def scan(self, text):
+        """
+            扫描文本，返回所有命中的 (模式, 终点)，耗时与命中的模式数量有关，与共享模式的姓名数量无关
+        """
+        occurrences = []
+        goto = self.__goto
+        fail = self.__fail
+        state = 0
+        for end, char in enumerate(text.lower(), 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            output_state = state if self.__state_pattern[state] is not None else self.__output_link[state]
+            while output_state:
+                occurrences.append((self.__state_pattern[output_state], end))
+                output_state = self.__output_link[output_state]
+        return occurrences
+
+    def __get_pattern_profiles(self, pattern_id):
+        pattern_profiles = self.__pattern_profiles.get(pattern_id)
+        if pattern_profiles is None:
+            feature_profiles = set()
+            shout_profiles = set()
+            shout_rows_profiles = set()
+            for index, tags in self.__pattern_profile_tags[pattern_id].items():
+                shout_rows = set(priority for stage, priority in tags if stage == STAGE_FEATURE_SHOUT)
+                if any(stage != STAGE_FEATURE_SHOUT for stage, _ in tags):
+                    feature_profiles.add(index)
+                if shout_rows:
+                    shout_profiles.add(index)
+                if len(shout_rows) >= 2:
+                    shout_rows_profiles.add(index)
+            # 多个线程同时计算时结果相同，直接覆盖
+            pattern_profiles = self.__pattern_profiles[pattern_id] = (feature_profiles, shout_profiles,
+                                                                      shout_rows_profiles)
+        return pattern_profiles
+
+    def candidates(self, email_user, occurrences):
+        """
+            获取权重可能超过阈值的姓名序号（按原顺序排列）
+            前三个阶段都没有匹配结果时删除内容后的文本与用户名部分相同，因此只需要考虑：
+            命中全名截断或倒序特征的姓名、命中首尾相接的两个片段的姓名，以及首字母阶段可能超过阈值的姓名
+        :param email_user:  去符号后的邮箱用户名部分
+        :param occurrences: scan 扫描用户名部分的结果
+        :return:            姓名序号列表
+        """
+        candidate_set = self.__initials_index.candidate_set(email_user)
+        start_patterns = {}
+        for pattern_id, end in occurrences:
+            candidate_set |= self.__get_pattern_profiles(pattern_id)[0]
+            start_patterns.setdefault(end - self.__pattern_lengths[pattern_id], []).append(pattern_id)
+        # 片段组合至少包含两个首尾相接、属于不同行的片段
+        for pattern_id, end in occurrences:
+            for next_pattern_id in start_patterns.get(end, ()):
+                if next_pattern_id == pattern_id:
+                    candidate_set |= self.__get_pattern_profiles(pattern_id)[2]
+                else:
+                    candidate_set |= self.__get_pattern_profiles(pattern_id)[1] & \
+                        self.__get_pattern_profiles(next_pattern_id)[1]
+        return sorted(candidate_set)
+
+    def profile_hits(self, occurrences, profile_index):
+        """
+            取出一个姓名的命中
+        :return:    {匹配阶段: [(起点, 终点, 优先级)]}
+        """
+        hits = {}
+        for pattern_id, end in occurrences:
+            tags = self.__pattern_profile_tags[pattern_id].get(profile_index)
+            if tags is None:
+                continue
+            start = end - self.__pattern_lengths[pattern_id]
+            for stage, priority in tags:
+                hits.setdefault(stage, []).append((start, end, priority))
+        return hits
+
+
+# 最近使用的姓名列表构造的自动机，同一份姓名列表重复出现时（例如服务合并的请求、重复使用的姓名表）不再重新构造
+_automaton_cache = collections.OrderedDict()
+_automaton_cache_lock = threading.Lock()
+
+
+def _get_automaton(profiles):
+    # 特征只取决于原始姓名，以原始姓名列表作为键
+    key = tuple(profile.original_name for profile in profiles)
+    with _automaton_cache_lock:
+        automaton = _automaton_cache.get(key)
+        if automaton is not None:
+            _automaton_cache.move_to_end(key)
+            return automaton
+    automaton = _AhoCorasickAutomaton(profiles)
+    with _automaton_cache_lock:
+        _automaton_cache[key] = automaton
+        while len(_automaton_cache) > AUTOMATON_CACHE_SIZE:
+            _automaton_cache.popitem(last=False)
+    return automaton
+
+
+def clear_caches():
+    """
+        清空进程内的姓名特征、规范化姓名以及自动机缓存，例如基准测试中每个选项都从空缓存开始
+    """
+    get_author_profile.cache_clear()
+    normalize_author.cache_clear()
+    with _automaton_cache_lock:
+        _automaton_cache.clear()
+
+
+class AhoCorasickEngine(object):
+    """
+        多模式匹配引擎
+        将整批姓名的全名截断、倒序以及片段组合特征构造为一个 Aho-Corasick 自动机（相同的姓名列表共享），
+        每个邮箱用户名部分只需扫描一次即可得到命中的特征，只有命中特征或首字母的姓名才需要计算权重
+    """
+
+    def __init__(self, profiles):
+        self.profiles = profiles
+        self.__profile_index = {id(profile): index for index, profile in enumerate(profiles)}
+        self.__automaton = _get_automaton(profiles)
+
+        # 当前邮箱用户名部分命中的 (模式, 终点)，以及最近一次查询的姓名的命中 {匹配阶段: [(起点, 终点, 优先级)]}
+        self.__email_user = None
+        self.__occurrences = []
+        self.__hits_key = None
+        self.__hits = {}
+
+    def scan(self, email_user):
+        self.__email_user = email_user
+        self.__occurrences = self.__automaton.scan(email_user)
+        self.__hits_key = None
+
+    def candidates(self, email_user):
+        """
+            由扫描结果获取权重可能超过阈值的姓名序号（按原顺序排列），必须先调用 scan
+        """
+        return self.__automaton.candidates(email_user, self.__occurrences)
+
+    def findall(self, profile, stage, text, stats=None):
+        profile_index = self.__profile_index[id(profile)]
+        if text == self.__email_user:
+            hits_key = profile_index
+        else:
+            # 删除匹配内容后的文本只属于当前姓名，重新扫描
+            hits_key = (profile_index, text)
+        if hits_key != self.__hits_key:
+            occurrences = self.__occurrences if text == self.__email_user else self.__automaton.scan(text)
+            self.__hits_key = hits_key
+            self.__hits = self.__automaton.profile_hits(occurrences, profile_index)
+        stage_hits = self.__hits.get(stage)
+        if not stage_hits:
+            return []
+        # 片段组合阶段：由命中的片段查找最长组合
+        if stage == STAGE_FEATURE_SHOUT:
+            fragment_hits = {}
+            for start, end, row_index in stage_hits:
+                fragment_hits.setdefault(start, []).append((row_index, end - start))
+            return find_fragment_sequences(text, lambda position: fragment_hits.get(position, ()), stats=stats)
+        # 与正则分支的语义一致：从左到右，同一起点取优先级最高的特征，匹配结果互不重叠
+        match_result = []
+        position = 0
+        for start, end, _ in sorted(stage_hits, key=lambda hit: (hit[0], hit[2])):
+            if start < position:
+                continue
+            match_result.append(text[start:end])
+            position = end
+        return match_result
+
+
+def weight_upper_bound(email_user, profile):
+    """
+        估算邮箱用户名部分与姓名特征的最大可能权重（未计算代价）
+        每个阶段匹配到的字母都来自用户名部分，且都属于姓名的字母集合；
+        用户名部分不包含任何单词的前两个字母（或其倒序）时，前三个阶段都不会有匹配结果
+    :param email_user:  去符号后的邮箱用户名部分
+    :param profile:     预编译的姓名特征
+    :return:            权重上界
+    """
+    return _bound_from_terms(weight_upper_bound_terms(email_user, profile))
+
+
+def weight_upper_bound_terms(email_user, profile):
+    """
+        分别估算各阶段的最大可能权重，即 weight_upper_bound 的各部分
+    :param email_user:  去符号后的邮箱用户名部分
+    :param profile:     预编译的姓名特征
+    :return:            (前三个阶段可能匹配的字母数, 连续首字母的权重上界, 不连续首字母的权重上界)
+    """
+
+    email_user_lower = email_user.lower()
+
+    # 全名截断、倒序（1.2 倍）以及片段组合（1.0 倍）三个阶段
+    feature_possible = any(bigram in email_user_lower for bigram in profile.feature_bigrams)
+    if feature_possible:
+        alphabet = profile.alphabet
+        alphabet_count = sum(1 for char in email_user_lower if char in alphabet)
+    else:
+        alphabet_count = 0
+
+    # 连续首字母（前面阶段删除内容后才可能拼接出首字母，因此也需要考虑 feature_possible）
+    first_char_con_bound = 0.0
+    first_char_folded = profile.first_char_folded
+    if first_char_folded and len(first_char_folded) <= len(email_user):
+        if feature_possible or profile.first_char_key in email_user_lower:
+            first_char_con_bound = 0.85 * len(first_char_folded)
+
+    # 不连续首字母，按区分大小写的不同字母计数
+    # 前面阶段没有匹配结果时，只有用户名部分全部由首字母组成才计入权重
+    first_char_bound = 0.0
+    if profile.first_char_list:
+        first_char_alphabet = profile.first_char_alphabet
+        first_char_count = sum(1 for char in set(email_user) if char.lower() in first_char_alphabet)
+        if feature_possible or first_char_count == len(email_user):
+            first_char_bound = 0.8 * first_char_count
+    else:
+        # 首字母为空时正则会匹配到一个空字符串
+        if feature_possible or len(email_user) == 1:
+            first_char_bound = 0.8
+
+    return alphabet_count, first_char_con_bound, first_char_bound
+
+
+def _bound_from_terms(bound_terms):
+    # 由 weight_upper_bound_terms 的结果计算权重上界，与 BoundMatrix 的计算顺序相同
+    alphabet_count, first_char_con_bound, first_char_bound = bound_terms
+    return (1.2 + 1.2 + 1.0) * alphabet_count + first_char_con_bound + first_char_bound + BOUND_EPSILON
+
+
+def _exit_early(stats, stage_index):
+    # 记录提前结束时跳过的阶段（从第 stage_index 个阶段开始）
+    if stats is not None:
+        stats.pairs_exited_early += 1
+        stats.stages_skipped.update(STAGES[stage_index - 1:])
+
+
+def _bigram_column(bigram):
+    # 两个小写字母在 26 × 26 列中的位置
+    return (ord(bigram[0]) - 97) * 26 + ord(bigram[1]) - 97
+
+
+class BoundMatrix(object):
+    """
+        使用 NumPy 批量计算 邮箱 × 姓名 的权重上界矩阵
+        用户名部分编码为字母计数、字母出现以及两字母片段出现矩阵，姓名编码为对应的字母集合、
+        首字母集合以及单词开头片段矩阵，通过矩阵乘法一次得到所有组合的上界，计算方式与 weight_upper_bound 完全一致
+    """
+
+    def __init__(self, profiles):
+        if numpy is None:
+            raise ImportError('NumPy is required for vectorized upper bounds.')
+
+        profiles_count = len(profiles)
+        # 姓名字母集合（26 个小写字母）
+        self.__alphabet = numpy.zeros((profiles_count, 26))
+        # 首字母集合，区分大小写（前 26 列为小写，后 26 列为大写）
+        self.__first_char_alphabet = numpy.zeros((profiles_count, 52))
+        # 单词前两个字母及其倒序（26 × 26 列）
+        self.__feature_bigrams = numpy.zeros((profiles_count, 26 * 26))
+        # 连续首字母的开头（前 26 × 26 列为两个字母，后 26 列为单个字母）
+        self.__first_char_key = numpy.zeros((profiles_count, 26 * 26 + 26))
+        # 连续首字母长度，无法匹配时为 0
+        self.__first_char_length = numpy.zeros(profiles_count)
+        # 首字母为空的姓名
+        self.__first_char_empty = numpy.zeros(profiles_count, dtype=bool)
+
+        for index, profile in enumerate(profiles):
+            for char in profile.alphabet:
+                self.__alphabet[index, ord(char) - 97] = 1
+            for char in profile.first_char_alphabet:
+                self.__first_char_alphabet[index, ord(char) - 97] = 1
+                self.__first_char_alphabet[index, ord(char) - 97 + 26] = 1
+            for bigram in profile.feature_bigrams:
+                self.__feature_bigrams[index, _bigram_column(bigram)] = 1
+            if profile.first_char_folded:
+                self.__first_char_length[index] = len(profile.first_char_folded)
+                if len(profile.first_char_key) == 2:
+                    self.__first_char_key[index, _bigram_column(profile.first_char_key)] = 1
+                else:
+                    self.__first_char_key[index, 26 * 26 + ord(profile.first_char_key) - 97] = 1
+            self.__first_char_empty[index] = not profile.first_char_list
+
+    def compute(self, email_users):
+        """
+            计算一批用户名部分与所有姓名的权重上界
+        :param email_users: 去符号后的邮箱用户名部分列表
+        :return:            形状为 (用户名数量, 姓名数量) 的矩阵
+        """
+        return _bound_from_terms(self.compute_terms(email_users))
+
+    def compute_terms(self, email_users):
+        """
+            计算一批用户名部分与所有姓名的权重上界的各部分，与 weight_upper_bound_terms 一致
+        :param email_users: 去符号后的邮箱用户名部分列表
+        :return:            三个形状为 (用户名数量, 姓名数量) 的矩阵组成的元组
+        """
+
+        email_users_count = len(email_users)
+        letter_count = numpy.zeros((email_users_count, 26))
+        letter_presence = numpy.zeros((email_users_count, 52))
+        # 两字母片段以及单个字母的出现情况
+        fragment_presence = numpy.zeros((email_users_count, 26 * 26 + 26))
+        email_user_length = numpy.zeros((email_users_count, 1))
+        for row, email_user in enumerate(email_users):
+            if not email_user:
+                continue
+            codes = numpy.frombuffer(email_user.encode('ascii'), dtype=numpy.uint8)
+            letters = (codes | 0x20).astype(numpy.intp) - 97
+            letter_count[row] = numpy.bincount(letters, minlength=26)
+            letter_presence[row, letters + 26 * (codes < 97)] = 1
+            fragment_presence[row, letters[:-1] * 26 + letters[1:]] = 1
+            fragment_presence[row, 26 * 26 + letters] = 1
+            email_user_length[row, 0] = len(email_user)
+
+        # 全名截断、倒序以及片段组合三个阶段
+        feature_possible = (fragment_presence[:, :26 * 26] @ self.__feature_bigrams.T) > 0
+        alphabet_count = (letter_count @ self.__alphabet.T) * feature_possible
+
+        # 连续首字母
+        first_char_key_present = (fragment_presence @ self.__first_char_key.T) > 0
+        first_char_possible = (feature_possible | first_char_key_present) & \
+            (self.__first_char_length <= email_user_length) & (self.__first_char_length > 0)
+        first_char_con_bound = 0.85 * self.__first_char_length * first_char_possible
+
+        # 不连续首字母
+        first_char_count = letter_presence @ self.__first_char_alphabet.T
+        first_char_count = numpy.where(self.__first_char_empty, 1.0, first_char_count)
+        first_char_counted = feature_possible | numpy.where(self.__first_char_empty, email_user_length == 1,
+                                                            first_char_count == email_user_length)
+        first_char_bound = 0.8 * first_char_count * first_char_counted
+        return alphabet_count, first_char_con_bound, first_char_bound
+
+
+class CandidateIndex(object):
+    """
+        候选姓名倒排索引
+        邮箱用户名部分至少包含以下特征之一时，姓名的权重才可能超过阈值：
+          1. 某个单词的前两个字母（全名截断和片段组合都以其开头）或其倒序
+          2. 连续首字母（前三个阶段都没有匹配结果时，连续首字母阶段只在原用户名部分中查找）
+          3. 用户名部分由互不相同且都是首字母的字母组成
+    """
+
+    def __init__(self, profiles, features=True):
+        """
+        :param profiles:    姓名特征列表
+        :param features:    是否索引单词的前两个字母，为假时只索引首字母（前三个阶段的候选由匹配引擎的命中得到）
+        """
+        self.profiles = profiles
+        self.__bigram_index = {}
+        self.__first_char_index = {}
+        self.__first_char_alphabet_index = {}
+
+        for index, profile in enumerate(profiles):
+            if features:
+                for bigram in profile.feature_bigrams:
+                    self.__bigram_index.setdefault(bigram, set()).add(index)
+
+            if profile.first_char_folded:
+                self.__first_char_index.setdefault(profile.first_char_folded, set()).add(index)
+
+            for folded_char in profile.first_char_alphabet:
+                self.__first_char_alphabet_index.setdefault(folded_char, set()).add(index)
+        # 连续首字母的所有长度
+        self.__first_char_lengths = sorted(set(len(first_char_folded) for first_char_folded in self.__first_char_index))
+
+    def candidates(self, email_user):
+        """
+            获取权重可能超过阈值的姓名序号（按原顺序排列）
+        :param email_user:  去符号后的邮箱用户名部分
+        :return:            姓名序号列表
+        """
+        return sorted(self.candidate_set(email_user))
+
+    def candidate_set(self, email_user):
+        """
+            获取权重可能超过阈值的姓名序号集合（新建的集合，调用方可以修改）
+        """
+
+        email_user_lower = email_user.lower()
+        candidate_set = set()
+
+        if self.__bigram_index:
+            for position in range(len(email_user_lower) - 1):
+                candidate_set.update(self.__bigram_index.get(email_user_lower[position:position + 2], ()))
+        for length in self.__first_char_lengths:
+            if length > len(email_user_lower):
+                break
+            for position in range(len(email_user_lower) - length + 1):
+                candidate_set.update(self.__first_char_index.get(email_user_lower[position:position + length], ()))
+
+        # 用户名部分的字母互不相同时，可能只由首字母组成
+        if len(email_user) >= 2 and len(set(email_user)) == len(email_user):
+            first_char_candidate_set = None
+            for char in set(email_user_lower):
+                char_candidate_set = self.__first_char_alphabet_index.get(char, set())
+                if first_char_candidate_set is None:
+                    first_char_candidate_set = char_candidate_set.copy()
+                else:
+                    first_char_candidate_set &= char_candidate_set
+                if not first_char_candidate_set:
+                    break
+            candidate_set.update(first_char_candidate_set)
+
+        return candidate_set
+
+
+class CorrelationStats(object):
+    """
+        匹配过程的统计计数
+    """
+
+    def __init__(self):
+        # 邮箱与姓名组合总数
+        self.pairs = 0
+        # 实际计算权重的组合数
+        self.pairs_scored = 0
+        # 被倒排索引（或匹配引擎的扫描结果）剪枝的组合数
+        self.pairs_pruned_by_index = 0
+        # 权重上界无法超过当前最优权重而跳过的组合数
+        self.pairs_pruned_by_bound = 0
+        # 计算权重过程中剩余阶段的权重上界无法胜出而提前结束的组合数
+        self.pairs_exited_early = 0
+        # 提前结束而跳过的阶段数 {阶段: 次数}
+        self.stages_skipped = collections.Counter()
+        # 片段组合搜索超过 MAX_FRAGMENT_SEARCH_STATES、只计入已找到的组合的组合数
+        self.pairs_fragment_capped = 0
+
+    @property
+    def pairs_pruned(self):
+        return self.pairs_pruned_by_index + self.pairs_pruned_by_bound
+
+    def __repr__(self):
+        return ('%s(pairs=%d, pairs_scored=%d, pairs_pruned_by_index=%d, pairs_pruned_by_bound=%d, '
+                'pairs_exited_early=%d, stages_skipped=%d, pairs_fragment_capped=%d)') % (
+            self.__class__.__name__, self.pairs, self.pairs_scored,
+            self.pairs_pruned_by_index, self.pairs_pruned_by_bound,
+            self.pairs_exited_early, sum(self.stages_skipped.values()), self.pairs_fragment_capped
+        )
+
+
+class StageEvent(object):
+    """
+        单个匹配阶段的跟踪事件
+    """
+
+    __slots__ = ('email', 'email_user', 'author', 'stage', 'features', 'matches', 'weight', 'elapsed')
+
+    def __init__(self, email, email_user, author, stage, features, matches, weight, elapsed=None):
+        # 邮箱以及该阶段匹配的用户名部分（已删除前面阶段匹配到的内容）
+        self.email = email
+        self.email_user = email_user
+        # 处理后的姓名
+        self.author = author
+        # 匹配阶段、该阶段的名字特征以及匹配结果
+        self.stage = stage
+        self.features = features
+        self.matches = matches
+        # 该阶段计入总权重的部分
+        self.weight = weight
+        # 该阶段耗时（秒），仅在 Tracer.timing 为真时统计
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return '%s(email=%r, author=%r, stage=%r, matches=%r, weight=%r)' % (
+            self.__class__.__name__, self.email, self.author, self.stage, self.matches, self.weight
+        )
+
+
+class Tracer(object):
+    """
+        匹配过程的跟踪接口，默认不做任何处理，子类按需覆盖
+    """
+
+    # 是否统计每个阶段的耗时
+    timing = False
+
+    def on_stage(self, event):
+        """
+            每个匹配阶段结束时调用
+        :param event:   StageEvent 对象
+        """
+
+    def on_score(self, email, author, weight):
+        """
+            邮箱与姓名的权重计算完成时调用
+        :param email:   邮箱
+        :param author:  处理后的姓名
+        :param weight:  匹配权重（未计算代价）
+        """
+
+    def on_update(self, email, name, weight, found):
+        """
+            邮箱的最优名字更新时调用
+        :param email:   邮箱
+        :param name:    名字
+        :param weight:  计算代价后的权重
+        :param found:   是否为该邮箱第一次匹配到名字
+        """
+
+
+class TracerGroup(Tracer):
+    """
+        将事件依次转发给多个 Tracer
+    """
+
+    def __init__(self, tracers):
+        self.tracers = list(tracers)
+        self.timing = any(tracer.timing for tracer in self.tracers)
+
+    def on_stage(self, event):
+        for tracer in self.tracers:
+            tracer.on_stage(event)
+
+    def on_score(self, email, author, weight):
+        for tracer in self.tracers:
+            tracer.on_score(email=email, author=author, weight=weight)
+
+    def on_update(self, email, name, weight, found):
+        for tracer in self.tracers:
+            tracer.on_update(email=email, name=name, weight=weight, found=found)
+
+
+class PrintTracer(Tracer):
+    """
+        打印匹配结果的更新过程，debug 时同时打印每个阶段的匹配情况
+    """
+
+    def __init__(self, verbose=True, debug=False, file=None):
+        self.verbose = verbose
+        self.debug = debug
+        self.file = file
+
+    def on_stage(self, event):
+        if self.debug:
+            print('- ' * 20, file=self.file)
+            print('Name: ', event.author, file=self.file)
+            print('Email:', event.email, file=self.file)
+            print('User Part:', event.email_user, file=self.file)
+            print('Stage:', event.stage, file=self.file)
+            print(event.features, file=self.file)
+            print(event.matches, file=self.file)
+            print(event.weight, file=self.file)
+
+    def on_score(self, email, author, weight):
+        if self.debug:
+            print('- ' * 20, file=self.file)
+            print('weight: ', weight, file=self.file)
+
+    def on_update(self, email, name, weight, found):
+        if self.verbose:
+            print("[+] %(option)s e-mail '%(email)s' author '%(author)s', weight %(weight).2f." %
+                  {
+                      'option': 'Fount' if found else 'Update', 'email': email,
+                      'author': name,
+                      'weight': weight
+                  }, file=self.file)
+
+
+class StageProfiler(Tracer):
+    """
+        按阶段汇总匹配次数、命中次数、权重以及耗时，用于分析哪个阶段占用时间最多
+    """
+
+    timing = True
+
+    def __init__(self):
+        # 阶段 -> {'calls': 执行次数, 'hits': 有匹配结果的次数, 'weight': 计入的权重和, 'elapsed': 耗时}
+        self.stages = collections.OrderedDict()
+        # 计算权重的组合数以及最优名字的更新次数
+        self.scores = 0
+        self.updates = 0
+
+    def on_stage(self, event):
+        counter = self.stages.get(event.stage)
+        if counter is None:
+            counter = self.stages[event.stage] = {'calls': 0, 'hits': 0, 'weight': 0.0, 'elapsed': 0.0}
+        counter['calls'] += 1
+        if event.matches:
+            counter['hits'] += 1
+        counter['weight'] += event.weight
+        counter['elapsed'] += event.elapsed or 0.0
+
+    def on_score(self, email, author, weight):
+        self.scores += 1
+
+    def on_update(self, email, name, weight, found):
+        self.updates += 1
+
+    def report(self):
+        """
+            生成文本报告
+        """
+        lines = ['%-16s %10s %10s %12s %10s' % ('stage', 'calls', 'hits', 'weight', 'seconds')]
+        for stage, counter in self.stages.items():
+            lines.append('%-16s %10d %10d %12.2f %10.4f' % (
+                stage, counter['calls'], counter['hits'], counter['weight'], counter['elapsed']
+            ))
+        lines.append('scores: %d, updates: %d' % (self.scores, self.updates))
+        return '\n'.join(lines)
+
+
+class ScoreCache(object):
+    """
+        邮箱用户名部分与姓名的权重缓存（LRU）
+        权重只取决于去符号后的用户名部分和姓名，与邮箱域名无关，
+        因此可以在多次 correlation 调用之间共享，例如在长期运行的工作进程中
+    """
+
+    def __init__(self, maxsize=SCORE_CACHE_SIZE):
+        if maxsize < 1:
+            raise ValueError('maxsize must be >= 1.')
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__weights = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, email_user, author):
+        """
+            获取缓存的权重
+        :param email_user:  去符号后的邮箱用户名部分
+        :param author:      原始姓名
+        :return:            (权重, 各阶段权重)（未计算代价），未记录各阶段权重时后者为 None，未缓存时返回 None
+        """
+        key = (email_user, author)
+        with self.__lock:
+            weight = self.__weights.get(key)
+            if weight is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.__weights.move_to_end(key)
+            return weight
+
+    def put(self, email_user, author, weight):
+        key = (email_user, author)
+        with self.__lock:
+            self.__weights[key] = weight
+            self.__weights.move_to_end(key)
+            while len(self.__weights) > self.maxsize:
+                self.__weights.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, email_user=None, author=None):
+        """
+            删除缓存，两个参数都为 None 时清空全部缓存
+        :param email_user:  只删除该用户名部分的缓存
+        :param author:      只删除该姓名的缓存
+        :return:            删除的数量
+        """
+        with self.__lock:
+            if email_user is None and author is None:
+                count = len(self.__weights)
+                self.__weights.clear()
+                return count
+            keys = [
+                key for key in self.__weights
+                if (email_user is None or key[0] == email_user) and (author is None or key[1] == author)
             ]
+            for key in keys:
+                del self.__weights[key]
+            return len(keys)
+
+    def clear(self):
+        """
+            清空缓存以及命中统计
+        """
+        self.invalidate()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self.__weights)
+
+    def __repr__(self):
+        return '%s(maxsize=%d, size=%d, hits=%d, misses=%d, evictions=%d)' % (
+            self.__class__.__name__, self.maxsize, len(self), self.hits, self.misses, self.evictions
+        )
+
+
+# 可选的匹配引擎
+ENGINES = {
+    'regex': RegexEngine,
+    'aho-corasick': AhoCorasickEngine,
+}
+
+
+def score(email, email_user, profile, engine=None, tracer=None, breakdown=None, limit=None, bound_terms=None,
+          stats=None):
+    """
+        计算邮箱用户名部分与姓名特征的匹配权重
+    :param email:       邮箱（仅用于跟踪）
+    :param email_user:  去符号后的邮箱用户名部分
+    :param profile:     预编译的姓名特征
+    :param engine:      已扫描当前邮箱的匹配引擎，默认逐个运行正则
+    :param tracer:      Tracer 对象，接收每个阶段的匹配事件（提前结束后的阶段不产生事件）
+    :param breakdown:   字典，传入时写入每个阶段实际计入的权重
+    :param limit:       计算前以及每个阶段之后估算权重上界，无法超过该值时提前结束
+    :param bound_terms: weight_upper_bound_terms 的结果，调用方已用其上界与 limit 比较时传入，不再重复计算
+    :param stats:       CorrelationStats 对象，记录提前结束的组合数、跳过的阶段数以及片段组合搜索超过上限的组合数
+    :return:            匹配权重（未计算代价），提前结束时返回 None
+    """
 
-            # 通过递归计算所有片段可能存在的组合
-            author_feature_shout_matrix = []
-
-            # 生成矩阵首行元素到末行元素之间所有可能的路径
-            def generate_path(matrix, **kwargs):
-                word_list = kwargs.get('word_list', list())
-                depth = kwargs.get('depth', 0)
-                # 递归深度在矩阵行数之内
-                if depth >= len(matrix):
-                    author_feature_shout_matrix.append(word_list)
-                    return
-                for row in matrix[depth]:
-                    generate_path(matrix=matrix, word_list=[*word_list, row], depth=depth + 1)
-
-            # 调用递归
-            generate_path(author_feature_shout_same_limit_matrix)
-
-            for author_feature_shout_row in author_feature_shout_matrix:
-                # print(author_feature_shout_row)
-                author_feature_shout_same_count = len(author_feature_shout_row)
-                # 词汇量过多可能造成内存暴涨，因此超过五个时统统跳过
-                if author_feature_shout_same_count > 5:
+    if engine is None:
+        engine = RegexEngine([profile])
+
+    # 未开启跟踪时不产生任何额外开销
+    timing = tracer is not None and tracer.timing
+    started = None
+
+    # 标记 TOP 3 算法是否有匹配结果
+    correlation_1_done = False
+    correlation_2_done = False
+    correlation_3_done = False
+
+    # 暂时保存处理后的姓名
+    author = profile.name
+
+    # 初始化但前权重
+    current_author_weight = 0
+
+    # 复制邮箱姓名部分副本
+    email_user_copy = ''.join(email_user)
+
+    # 权重上界无法超过 limit 时提前结束，剩余阶段的上界由 weight_upper_bound_terms 的各部分增量计算：
+    #   删除的内容都由姓名的字母组成，剩余可能匹配的字母数即减去删除的长度；
+    #   前三个阶段有匹配结果时用户名部分已经变短，连续首字母不可能再满足计入权重的条件
+    if limit is not None:
+        if bound_terms is None:
+            bound_terms = weight_upper_bound_terms(email_user, profile)
+            if _bound_from_terms(bound_terms) <= limit:
+                _exit_early(stats, 1)
+                return None
+        alphabet_count, first_char_con_bound, first_char_bound = bound_terms
+
+    # = = = = = 匹配全名以及全名截断（连续字母） = = = = =
+
+    if timing:
+        started = time.perf_counter()
+    # 匹配名字单词特征
+    author_feature_match_result = engine.findall(profile, STAGE_FEATURE, email_user_copy)
+    # 获取权重（按字母数计算）
+    current_author_feature_weight = sum([
+        len(author_feature) for author_feature in author_feature_match_result
+    ])
+    # 名字单词字母连续，应强化权重
+    current_author_feature_weight = 1.2 * current_author_feature_weight
+    current_author_weight += current_author_feature_weight
+
+    # 有结果时标记
+    if current_author_feature_weight != 0:
+        correlation_1_done = True
+
+    # - - - - - 跟踪匹配过程 - - - - -
+    if tracer is not None:
+        tracer.on_stage(StageEvent(email=email, email_user=email_user_copy, author=author, stage=STAGE_FEATURE,
+                                   features=profile.feature_list, matches=author_feature_match_result,
+                                   weight=current_author_feature_weight,
+                                   elapsed=time.perf_counter() - started if timing else None))
+    # - - - - - 跟踪匹配过程 - - - - -
+
+    # 删除匹配到的内容，避免重复匹配
+    for author_feature in author_feature_match_result:
+        email_user_copy = email_user_copy.replace(author_feature, '')
+
+    if limit is not None:
+        if correlation_1_done:
+            first_char_con_bound = 0.0
+        remaining_alphabet_count = alphabet_count - (len(email_user) - len(email_user_copy))
+        remaining_bound = (1.2 + 1.0) * remaining_alphabet_count + first_char_con_bound + first_char_bound + \
+            BOUND_EPSILON
+        if current_author_weight + remaining_bound <= limit:
+            _exit_early(stats, 2)
+            return None
+
+    # = = = = = 匹配全名以及全名截断的倒序情况（连续字母） = = = = =
+
+    # 对所有名字单词截断进行反转
+    # 目的是为了识别故意将名字部分倒转的情况
+    #  e.g. Name:  Kazuhiro Yoneda
+    #       Email: dradenoy@ybb.ne.jp
+
+    if timing:
+        started = time.perf_counter()
+    # 匹配名字单词特征
+    author_feature_reverse_match_result = engine.findall(profile, STAGE_FEATURE_REVERSE, email_user_copy)
+    # 获取权重（按字母数计算）
+    current_author_feature_reverse_weight = sum([
+        len(author_feature_reverse) for author_feature_reverse in author_feature_reverse_match_result
+    ])
+    # 名字单词字母连续，应强化权重
+    current_author_feature_reverse_weight = 1.2 * current_author_feature_reverse_weight
+    current_author_weight += current_author_feature_reverse_weight
+
+    # 有结果时标记
+    if current_author_feature_reverse_weight != 0:
+        correlation_2_done = True
+
+    # - - - - - 跟踪匹配过程 - - - - -
+    if tracer is not None:
+        tracer.on_stage(StageEvent(email=email, email_user=email_user_copy, author=author, stage=STAGE_FEATURE_REVERSE,
+                                   features=profile.feature_reverse_list, matches=author_feature_reverse_match_result,
+                                   weight=current_author_feature_reverse_weight,
+                                   elapsed=time.perf_counter() - started if timing else None))
+    # - - - - - 跟踪匹配过程 - - - - -
+
+    # 删除匹配到的内容，避免重复匹配
+    for author_feature_reverse in author_feature_reverse_match_result:
+        email_user_copy = email_user_copy.replace(author_feature_reverse, '')
+
+    if limit is not None:
+        if correlation_2_done:
+            first_char_con_bound = 0.0
+        remaining_alphabet_count = alphabet_count - (len(email_user) - len(email_user_copy))
+        remaining_bound = 1.0 * remaining_alphabet_count + first_char_con_bound + first_char_bound + BOUND_EPSILON
+        if current_author_weight + remaining_bound <= limit:
+            _exit_early(stats, 3)
+            return None
+
+    # # = = = = = 匹配名字每个词前n字母组合（n小段连续字母，每段都由单词的前 2～3 个字母组成） = = = = =
+
+    #  e.g. Name:  Yasuhiro KAWAI
+    #       Email: kaya@nih.go.jp
+
+    if timing:
+        started = time.perf_counter()
+    # 匹配名字单词特征
+    author_feature_shout_match_result = engine.findall(profile, STAGE_FEATURE_SHOUT, email_user_copy, stats=stats)
+    # 获取权重（按字母数计算）
+    current_author_feature_shout_weight = sum([
+        len(author_feature_shout) for author_feature_shout in author_feature_shout_match_result
+    ])
+    # 权重不变化
+    current_author_feature_shout_weight = 1.0 * current_author_feature_shout_weight
+    current_author_weight += current_author_feature_shout_weight
+
+    # 有结果时标记
+    if current_author_feature_shout_weight != 0:
+        correlation_3_done = True
+
+    # - - - - - 跟踪匹配过程 - - - - -
+    if tracer is not None:
+        tracer.on_stage(StageEvent(email=email, email_user=email_user_copy, author=author, stage=STAGE_FEATURE_SHOUT,
+                                   features=profile.feature_shout_table, matches=author_feature_shout_match_result,
+                                   weight=current_author_feature_shout_weight,
+                                   elapsed=time.perf_counter() - started if timing else None))
+    # - - - - - 跟踪匹配过程 - - - - -
+
+    # 删除匹配到的内容，避免重复匹配
+    for author_feature_shout in author_feature_shout_match_result:
+        email_user_copy = email_user_copy.replace(author_feature_shout, '')
+
+    if limit is not None:
+        if correlation_3_done:
+            first_char_con_bound = 0.0
+        remaining_bound = first_char_con_bound + first_char_bound + BOUND_EPSILON
+        if current_author_weight + remaining_bound <= limit:
+            _exit_early(stats, 4)
+            return None
+
+    # = = = = = 匹配姓名首字母（连续字母，需要名字和邮箱的顺序恰好一致） = = = = =
+    #  e.g. Name:  Reginald Q Knight
+    #       Email: rqkspine1@aol.com
+    #  e.g. Name:  Taniya Bardhan
+    #       Email: tb1@nibmg.ac.in
+    #  e.g. Name:  Bornali Bhattacharjee
+    #       Email: bb2@nibmg.ac.in
+
+    if timing:
+        started = time.perf_counter()
+    # 匹配名字首字母
+    author_first_char_con_match_result = profile.search_first_char_con(email_user_copy)
+    if author_first_char_con_match_result is not None:
+        author_first_char_con_match_list = [author_first_char_con_match_result]
+        author_first_char_match_count = len(author_first_char_con_match_result)
+        # 获取权重（按字母数计算）
+        current_author_first_char_weight = author_first_char_match_count
+        # 此处为首字母连续，也应弱化权重
+        current_author_first_char_weight = 0.85 * current_author_first_char_weight
+        # 条件1：邮箱姓名部分只由首字母组成
+        con1 = len(email_user) == author_first_char_match_count
+        # 条件2：前面没有任何有匹配到情况
+        con2 = not (correlation_1_done or correlation_2_done or correlation_3_done)
+        # 满足以上任意一种则参与权重计算
+        if con1 or con2:
+            current_author_weight += current_author_first_char_weight
+        else:
+            current_author_first_char_weight = 0
+    else:
+        author_first_char_con_match_list = []
+        current_author_first_char_weight = 0
+    current_author_first_char_con_weight = current_author_first_char_weight
+
+    # - - - - - 跟踪匹配过程 - - - - -
+    if tracer is not None:
+        tracer.on_stage(StageEvent(email=email, email_user=email_user_copy, author=author, stage=STAGE_FIRST_CHAR_CON,
+                                   features=profile.first_char_list, matches=author_first_char_con_match_list,
+                                   weight=current_author_first_char_weight,
+                                   elapsed=time.perf_counter() - started if timing else None))
+    # - - - - - 跟踪匹配过程 - - - - -
+
+    # 连续首字母阶段不删除内容，不连续首字母的上界不变
+    if limit is not None:
+        remaining_bound = first_char_bound + BOUND_EPSILON
+        if current_author_weight + remaining_bound <= limit:
+            _exit_early(stats, 5)
+            return None
+
+    # = = = = = 匹配姓名首字母（不连续字母） = = = = =
+
+    if timing:
+        started = time.perf_counter()
+    # 匹配名字首字母
+    author_first_char_match_result = profile.findall_first_char(email_user_copy)
+    # 忽略单字母多次出现
+    author_first_char_match_result = list(set(author_first_char_match_result))
+    author_first_char_match_count = len(author_first_char_match_result)
+
+    # 获取权重（按字母数计算）
+    current_author_first_char_weight = author_first_char_match_count
+    # 首字母不连续，应弱化权重
+    current_author_first_char_weight = 0.8 * current_author_first_char_weight
+    # 条件1：邮箱姓名部分只由首字母组成
+    con1 = len(email_user) == author_first_char_match_count
+    # 条件2：前面有已经有匹配到的情况（因为首字母不联系的情况可能很不准确）
+    con2 = correlation_1_done or correlation_2_done or correlation_3_done
+    # 满足以上任意一种则参与权重计算
+    if con1 or con2:
+        current_author_weight += current_author_first_char_weight
+    else:
+        current_author_first_char_weight = 0
+
+    # - - - - - 跟踪匹配过程 - - - - -
+    if tracer is not None:
+        tracer.on_stage(StageEvent(email=email, email_user=email_user_copy, author=author, stage=STAGE_FIRST_CHAR,
+                                   features=profile.first_char_list, matches=author_first_char_match_result,
+                                   weight=current_author_first_char_weight,
+                                   elapsed=time.perf_counter() - started if timing else None))
+    # - - - - - 跟踪匹配过程 - - - - -
+
+    if breakdown is not None:
+        breakdown[STAGE_FEATURE] = current_author_feature_weight
+        breakdown[STAGE_FEATURE_REVERSE] = current_author_feature_reverse_weight
+        breakdown[STAGE_FEATURE_SHOUT] = current_author_feature_shout_weight
+        breakdown[STAGE_FIRST_CHAR_CON] = current_author_first_char_con_weight
+        breakdown[STAGE_FIRST_CHAR] = current_author_first_char_weight
+
+    if tracer is not None:
+        tracer.on_score(email=email, author=author, weight=current_author_weight)
+
+    return current_author_weight
+
+
+def _unique_authors(author_list, author_positions, normalized_authors=None):
+    """
+        去除规范化后为空的姓名，规范化后相同的姓名特征相同，只保留第一个
+    :param normalized_authors:  已出现的规范化姓名集合，会加入新出现的姓名
+    :return:                    (姓名列表, 姓名位置列表)
+    """
+    if normalized_authors is None:
+        normalized_authors = set()
+    unique_author_list = []
+    unique_author_positions = []
+    for author, position in zip(author_list, author_positions):
+        normalized_author = normalize_author(author)
+        if normalized_author.strip() == '' or normalized_author in normalized_authors:
+            continue
+        normalized_authors.add(normalized_author)
+        unique_author_list.append(author)
+        unique_author_positions.append(position)
+    return unique_author_list, unique_author_positions
+
+
+def _iter_correlation(email_list, author_list, keep_original=False, engine='regex', prune=False, stats=None,
+                      tracer=None, cache=None, vectorized=False, candidates=False, profile_index=None,
+                      best_weights=None, author_positions=None, early_exit=False):
+    """
+        逐个邮箱匹配对应的名字，参数与 correlation 相同
+    :param candidates:  是否记录所有超过阈值的候选名字及各阶段权重
+    :param best_weights:    {邮箱: 最优权重}，从之前的最优权重继续匹配（用于追加姓名）
+    :param author_positions:    每个姓名在完整姓名列表中的位置，默认为姓名的序号
+    :param early_exit:  计算权重时是否在每个阶段之后估算权重上界，无法胜出时提前结束
+    :return:            生成器，产出 (邮箱, 更新列表, 候选列表)，更新列表按顺序记录该邮箱最优名字的每次更新 (名字, 权重)，
+                        候选列表按姓名顺序记录 (名字, 权重, 各阶段权重, 姓名位置, 未计算代价的权重)，
+                        未开启 candidates 时为 None
+    """
+
+    if engine not in ENGINES:
+        raise ValueError('Unknown engine %r, expected one of %s.' % (engine, ', '.join(ENGINES)))
+
+    # 检查参数
+    email_list = [
+        email for email in email_list if '@' in email
+    ]
+    if author_positions is None:
+        author_positions = range(len(author_list))
+    author_list, author_positions = _unique_authors(author_list, author_positions)
+
+    # 每个姓名只构造一次特征，优先从索引文件读取；缓存容量至少能容纳本次的所有姓名
+    get_author_profile.fit(len(author_list))
+    profiles = [
+        (profile_index.get(author) if profile_index is not None else None) or get_author_profile(author)
+        for author in author_list
+    ]
+    matcher = ENGINES[engine](profiles)
+    # 倒排索引在匹配引擎不能给出候选姓名时才构造
+    candidate_index = None
+    bound_matrix = BoundMatrix(profiles) if vectorized else None
+
+    # 取邮箱姓名部分并去符号
+    email_user_list = [
+        NON_ALPHABET_CHARACTER_REGEX.subn('', email.split('@')[0])[0] for email in email_list
+    ]
+
+    block_bound_terms = None
+    block_upper_bounds = None
+    for email_index, email in enumerate(email_list):
+        email_user = email_user_list[email_index]
+
+        # 每个邮箱只扫描一次
+        matcher.scan(email_user)
+
+        # 只对可能超过阈值的姓名计算权重，匹配引擎能够由扫描结果给出候选姓名时优先使用（比倒排索引更少）
+        candidate_indexes = matcher.candidates(email_user)
+        if candidate_indexes is None and prune:
+            if candidate_index is None:
+                candidate_index = CandidateIndex(profiles)
+            candidate_indexes = candidate_index.candidates(email_user)
+        is_pruned_by_index = candidate_indexes is not None
+        if candidate_indexes is None:
+            candidate_indexes = list(range(len(profiles)))
+        index_candidates_count = len(candidate_indexes)
+
+        # 向量化计算一批邮箱与所有姓名的权重上界，并筛选上界超过阈值的姓名
+        upper_bounds = None
+        row_bound_terms = None
+        if bound_matrix is not None:
+            block_offset = email_index % VECTOR_BLOCK_SIZE
+            if block_offset == 0:
+                block_bound_terms = bound_matrix.compute_terms(
+                    email_user_list[email_index:email_index + VECTOR_BLOCK_SIZE]
+                )
+                block_upper_bounds = _bound_from_terms(block_bound_terms)
+            row_upper_bounds = block_upper_bounds[block_offset]
+            above_threshold = numpy.flatnonzero(row_upper_bounds > WEIGHT_THRESHOLD)
+            if is_pruned_by_index:
+                above_threshold = numpy.intersect1d(above_threshold, candidate_indexes, assume_unique=True)
+            candidate_indexes = above_threshold.tolist()
+            upper_bounds = row_upper_bounds.tolist()
+            # 提前结束时由各部分继续估算剩余阶段的上界
+            if early_exit:
+                row_bound_terms = [terms[block_offset].tolist() for terms in block_bound_terms]
+
+        if stats is not None:
+            stats.pairs += len(profiles)
+            stats.pairs_pruned_by_index += len(profiles) - index_candidates_count
+            stats.pairs_pruned_by_bound += index_candidates_count - len(candidate_indexes)
+
+        best_author_feature_weight = best_weights.get(email, 0) if best_weights is not None else 0
+        updates = []
+        email_candidates = [] if candidates else None
+        for index in candidate_indexes:
+            profile = profiles[index]
+
+            # 权重上界无法超过阈值以及当前最优权重时跳过（记录候选名字时只比较阈值）
+            bound_terms = None
+            if upper_bounds is not None or prune:
+                if upper_bounds is not None:
+                    upper_bound = upper_bounds[index]
+                    if row_bound_terms is not None:
+                        bound_terms = (row_bound_terms[0][index], row_bound_terms[1][index], row_bound_terms[2][index])
+                elif early_exit:
+                    bound_terms = weight_upper_bound_terms(email_user, profile)
+                    upper_bound = _bound_from_terms(bound_terms)
+                else:
+                    upper_bound = weight_upper_bound(email_user, profile)
+                if upper_bound <= WEIGHT_THRESHOLD or (not candidates and upper_bound <= best_author_feature_weight):
+                    if stats is not None:
+                        stats.pairs_pruned_by_bound += 1
                     continue
-                for count in range(2, author_feature_shout_same_count + 1):
-                    for permutations in itertools.permutations(author_feature_shout_row, count):
-                        author_feature_shout_list.append(''.join(permutations))
-
-            # 去重排序
-            author_feature_shout_list = list(set(author_feature_shout_list))
-            author_feature_shout_list = sorted(author_feature_shout_list, key=lambda i: len(i), reverse=True)
-
-            author_feature_shout_regex_str = '|'.join(author_feature_shout_list)
-            # 匹配名字单词特征
-            author_feature_shout_match_result = re.findall(author_feature_shout_regex_str, email_user_copy,
-                                                           re.IGNORECASE)
-            # 获取权重（按字母数计算）
-            current_author_feature_shout_weight = sum([
-                len(author_feature_shout) for author_feature_shout in author_feature_shout_match_result
-            ])
-            # 权重不变化
-            current_author_feature_shout_weight = 1.0 * current_author_feature_shout_weight
-            current_author_weight += current_author_feature_shout_weight
-
-            # 有结果时标记
-            if current_author_feature_shout_weight != 0:
-                correlation_3_done = True
-
-            # - - - - - 打印调试日志 - - - - -
-            if debug:
-                print('= ' * 20)
-                print('Name: ', author)
-                print('Email:', email)
-                print('User Part:', email_user_copy)
-                print(author_feature_shout_list)
-                print(author_feature_shout_regex_str)
-                print(author_feature_shout_match_result)
-                print(current_author_feature_shout_weight)
-            # - - - - - 打印调试日志 - - - - -
-
-            # 删除匹配到的内容，避免重复匹配
-            for author_feature_shout in author_feature_shout_match_result:
-                email_user_copy = email_user_copy.replace(author_feature_shout, '')
-
-            # = = = = = 匹配姓名首字母（连续字母，需要名字和邮箱的顺序恰好一致） = = = = =
-            #  e.g. Name:  Reginald Q Knight
-            #       Email: rqkspine1@aol.com
-            #  e.g. Name:  Taniya Bardhan
-            #       Email: tb1@nibmg.ac.in
-            #  e.g. Name:  Bornali Bhattacharjee
-            #       Email: bb2@nibmg.ac.in
-
-            # 将名字切割为单词构造名字单词列表
-            author_words_list = author_words_list_after_non_word_character_split.copy()
-            # 除去单字符单词，获取单词首字母，构造名字首字母列表以及对应的正则
-            author_first_char_list = [
-                author_words[0] for author_words in author_words_list
-                if len(author_words) > 0  # 避免出现空字符串的情况
-            ]
-            author_first_char_con_regex_str = ''.join(author_first_char_list)
-            # 匹配名字首字母
-            author_first_char_con_match = re.search(author_first_char_con_regex_str,
-                                                    email_user_copy,
-                                                    re.IGNORECASE)
-            if author_first_char_con_match is not None:
-                author_first_char_con_match_result = author_first_char_con_match.group()
-                author_first_char_match_count = len(author_first_char_con_match_result)
-                # 获取权重（按字母数计算）
-                current_author_first_char_weight = author_first_char_match_count
-                # 此处为首字母连续，也应弱化权重
-                current_author_first_char_weight = 0.85 * current_author_first_char_weight
-                # 条件1：邮箱姓名部分只由首字母组成
-                con1 = len(email_user) == author_first_char_match_count
-                # 条件2：前面没有任何有匹配到情况
-                con2 = not (correlation_1_done or correlation_2_done or correlation_3_done)
-                # 满足以上任意一种则参与权重计算
-                if con1 or con2:
-                    current_author_weight += current_author_first_char_weight
-
-                # - - - - - 打印调试日志 - - - - -
-                if debug:
-                    print('- ' * 20)
-                    print('Name: ', author)
-                    print('Email:', email)
-                    print('User Part:', email_user_copy)
-                    print(author_first_char_list)
-                    print(author_first_char_con_regex_str)
-                    print(author_first_char_con_match_result)
-                    print(current_author_first_char_weight)
-                # - - - - - 打印调试日志 - - - - -
-
-                if debug:
-                    print('- ' * 20)
-                    print('weight: ', current_author_weight)
-
-            # = = = = = 匹配姓名首字母（不连续字母） = = = = =
-
-            # 将名字切割为单词构造名字单词列表
-            author_words_list = author_words_list_after_non_word_character_split.copy()
-            # 除去单字符单词，获取单词首字母，构造名字首字母列表以及对应的正则
-            author_first_char_list = [
-                author_words[0] for author_words in author_words_list
-                if len(author_words) > 0  # 避免出现空字符串的情况
-            ]
-            author_first_char_regex_str = '|'.join(author_first_char_list)
-            # 匹配名字首字母
-            author_first_char_match_result = re.findall(author_first_char_regex_str, email_user_copy,
-                                                        re.IGNORECASE)
-            # 忽略单字母多次出现
-            author_first_char_match_result = list(set(author_first_char_match_result))
-            author_first_char_match_count = len(author_first_char_match_result)
-
-            # 获取权重（按字母数计算）
-            current_author_first_char_weight = author_first_char_match_count
-            # 首字母不连续，应弱化权重
-            current_author_first_char_weight = 0.8 * current_author_first_char_weight
-            # 条件1：邮箱姓名部分只由首字母组成
-            con1 = len(email_user) == author_first_char_match_count
-            # 条件2：前面有已经有匹配到的情况（因为首字母不联系的情况可能很不准确）
-            con2 = correlation_1_done or correlation_2_done or correlation_3_done
-            # 满足以上任意一种则参与权重计算
-            if con1 or con2:
-                current_author_weight += current_author_first_char_weight
-
-            # - - - - - 打印调试日志 - - - - -
-            if debug:
-                print('- ' * 20)
-                print('Name: ', author)
-                print('Email:', email)
-                print('User Part:', email_user_copy)
-                print(author_first_char_list)
-                print(author_first_char_regex_str)
-                print(author_first_char_match_result)
-                print(current_author_first_char_weight)
-            # - - - - - 打印调试日志 - - - - -
-
-            if debug:
-                print('- ' * 20)
-                print('weight: ', current_author_weight)
+
+            # 优先使用缓存的权重（命中缓存时不产生阶段跟踪事件）
+            cached = None
+            if cache is not None:
+                cached = cache.get(email_user, profile.original_name)
+            if cached is not None and (not candidates or cached[1] is not None):
+                current_author_weight, current_author_stages = cached
+            else:
+                if stats is not None:
+                    stats.pairs_scored += 1
+                # 记录候选名字时只需要超过阈值，否则还需要超过当前最优权重
+                limit = None
+                if early_exit:
+                    limit = WEIGHT_THRESHOLD if candidates else max(WEIGHT_THRESHOLD, best_author_feature_weight)
+                current_author_stages = {} if candidates else None
+                current_author_weight = score(email=email, email_user=email_user, profile=profile, engine=matcher,
+                                              tracer=tracer, breakdown=current_author_stages, limit=limit,
+                                              bound_terms=bound_terms, stats=stats)
+                # 提前结束的权重不完整，不能缓存
+                if current_author_weight is None:
+                    continue
+                if cache is not None:
+                    cache.put(email_user, profile.original_name, (current_author_weight, current_author_stages))
 
             # 权重必须 > 0.8 才进行权重更新操作
-            if current_author_weight <= 0.8:
+            if current_author_weight <= WEIGHT_THRESHOLD:
                 continue
 
+            # 名字越短，需要确定的信息越少，代价越小
+            current_author_scaled_weight = current_author_weight
+            if profile.cost_factor is not None:
+                current_author_scaled_weight = current_author_weight * profile.cost_factor
+            # 根据参数选择是否保留名字处理后的变化
+            name = profile.original_name if keep_original else profile.name
+
+            # 记录所有超过阈值的候选名字
+            if email_candidates is not None:
+                email_candidates.append((name, current_author_scaled_weight, current_author_stages,
+                                         author_positions[index], current_author_weight))
+
             # 判断权重非零并选择最优权重
             is_not_zero_weight = current_author_weight != 0
             is_best_weight = current_author_weight > best_author_feature_weight
             if is_not_zero_weight and is_best_weight:
-                # 名字越短，需要确定的信息越少，代价越小
-                # 代价函数 1 - abs(1 - (1 / (x - 1) ^ 0.5)) 在变量域 [2, +∞)里，值域为 [0, 1)
-                cost_factor = 1 - abs(1 - (1 / (author_words_count - 1) ** 0.5))
-                if author_words_count >= 2:
-                    current_author_weight = current_author_weight * cost_factor
-                # 根据参数选择是否保留名字处理后的变化
-                name = original_author_name if keep_original else author
-                storager.update(email=email,
-                                name=name,
-                                name_weight=current_author_weight)
-                print("[+] %(option)s e-mail '%(email)s' author '%(author)s', weight %(weight).2f." %
-                      {
-                          'option': 'Fount' if best_author_feature_weight == 0 else 'Update', 'email': email,
-                          'author': name,
-                          'weight': current_author_weight
-                      })
+                updates.append((name, current_author_scaled_weight))
+                if tracer is not None:
+                    tracer.on_update(email=email, name=name, weight=current_author_scaled_weight,
+                                     found=best_author_feature_weight == 0)
                 # 更新最优权重
-                best_author_feature_weight = current_author_weight
+                best_author_feature_weight = current_author_scaled_weight
+
+        yield email, updates, email_candidates
+
+
+def assign_one_to_one(email_weights):
+    """
+        为邮箱分配名字，每个名字最多分配给一个邮箱，并使分配的权重总和最大
+        只在超过阈值的 (邮箱, 名字) 之间建边，使用带势能的最短增广路（匈牙利算法），
+        每个邮箱另有一个权重为 0 的虚拟名字，表示不分配；每次增广只访问与当前邮箱相连、且距离小于已找到的空闲列的部分，
+        因此互不相连的邮箱组各自独立求解，耗时取决于最大的连通部分：
+        一个连通部分有 3000 个邮箱、每个邮箱 10 个名字时约 0.5 秒，5000 个邮箱、每个邮箱 20 个名字时约 2 秒
+    :param email_weights:   {邮箱: {名字: 权重（已计算代价）}}
+    :return:                {邮箱: 名字}，没有分配到名字的邮箱不出现
+    """
+
+    emails = list(email_weights)
+    name_columns = {}
+    for email in emails:
+        for name in email_weights[email]:
+            name_columns.setdefault(name, len(name_columns))
+    names = list(name_columns)
+    names_count = len(names)
+
+    # 每行代价为 (该行最大权重 - 权重)，都为非负数；虚拟名字的列号为 names_count + 行号
+    row_edges = []
+    for row, email in enumerate(emails):
+        weights = email_weights[email]
+        max_weight = max(weights.values()) if weights else 0
+        edges = [(name_columns[name], max_weight - weight) for name, weight in weights.items()]
+        edges.append((names_count + row, max_weight))
+        row_edges.append(edges)
+
+    row_potentials = [0.0] * len(emails)
+    column_potentials = [0.0] * (names_count + len(emails))
+    column_rows = [None] * (names_count + len(emails))
+    row_columns = [None] * len(emails)
+
+    for start_row, edges in enumerate(row_edges):
+        if len(edges) == 1:
+            continue
+
+        # Dijkstra 寻找到任意空闲列的最短增广路；空闲列只记录目前最短的一个，不放入堆，
+        # 距离不小于该列的列不会出现在最短增广路上，同样不放入堆
+        distances = {}
+        predecessors = {}
+        finished = {}
+        heap = []
+        end_column, end_distance = None, float('inf')
+
+        def relax(row, distance, edges):
+            nonlocal end_column, end_distance
+            base_distance = distance - row_potentials[row]
+            for column, cost in edges:
+                next_distance = base_distance + cost - column_potentials[column]
+                if next_distance >= end_distance or column in finished:
+                    continue
+                if column_rows[column] is None:
+                    end_column, end_distance = column, next_distance
+                    predecessors[column] = row
+                elif next_distance < distances.get(column, end_distance):
+                    distances[column] = next_distance
+                    predecessors[column] = row
+                    heapq.heappush(heap, (next_distance, column))
+
+        relax(start_row, 0.0, edges)
+        while heap and heap[0][0] < end_distance:
+            distance, column = heapq.heappop(heap)
+            if column in finished:
+                continue
+            finished[column] = distance
+            row = column_rows[column]
+            relax(row, distance, row_edges[row])
+
+        # 更新势能，保持所有边的约化代价非负
+        row_potentials[start_row] += end_distance
+        for column, distance in finished.items():
+            delta = end_distance - distance
+            if delta > 0:
+                column_potentials[column] -= delta
+                row = column_rows[column]
+                if row is not None:
+                    row_potentials[row] += delta
+
+        # 沿增广路翻转分配
+        column = end_column
+        while True:
+            row = predecessors[column]
+            previous_column = row_columns[row]
+            row_columns[row] = column
+            column_rows[column] = row
+            if row == start_row:
+                break
+            column = previous_column
+
+    return {
+        emails[row]: names[column]
+        for row, column in enumerate(row_columns)
+        if column is not None and column < names_count
+    }
+
+
+class CorrelationSession(object):
+    """
+        长期存在的匹配会话，邮箱和姓名可以分批加入
+        每个邮箱按姓名加入的顺序匹配，并记录当前最优权重；新的姓名只与已有邮箱匹配，新的邮箱只与已有姓名匹配，
+        结果与对所有邮箱和姓名调用一次 correlation 相同
+    """
+
+    def __init__(self, keep_original=False, engine='regex', prune=False, vectorized=False, stats=None, tracer=None,
+                 cache=None, storager=None, profile_index=None, early_exit=False):
+        """
+            其它参数与 correlation 相同
+        :param storager:    Storager 对象，默认只保留最优名字
+        """
+        self.storager = storager if storager is not None else Storager()
+        self.email_list = []
+        self.author_list = []
+        self.__options = dict(keep_original=keep_original, engine=engine, prune=prune, vectorized=vectorized,
+                              stats=stats, tracer=tracer, cache=cache, profile_index=profile_index,
+                              early_exit=early_exit)
+        self.__known_emails = set()
+        self.__normalized_authors = set()
+        # 每个邮箱当前的最优权重，即最后一次更新的权重
+        self.__best_weights = {}
+
+    def __correlate(self, email_list, author_list, author_offset):
+        changed_owners = {}
+        for email, updates, candidates in _iter_correlation(email_list=email_list, author_list=author_list,
+                                                            best_weights=self.__best_weights,
+                                                            candidates=self.storager.track_candidates,
+                                                            author_positions=range(author_offset,
+                                                                                   author_offset + len(author_list)),
+                                                            **self.__options):
+            if not updates and not candidates:
+                continue
+            owner = self.storager.get(email)
+            for name, name_weight in updates:
+                self.storager.update(email=email, name=name, name_weight=name_weight)
+            for name, name_weight, stages, position, raw_weight in candidates or ():
+                self.storager.add_candidate(email=email, name=name, name_weight=name_weight, stages=stages,
+                                            position=position, raw_weight=raw_weight)
+            if updates:
+                self.__best_weights[email] = updates[-1][1]
+            if self.storager.get(email) != owner:
+                changed_owners[email] = self.storager.get(email)
+        return changed_owners
+
+    def add_authors(self, author_list):
+        """
+            加入姓名，只计算新姓名与已有邮箱的权重，规范化后与已加入的姓名相同的姓名忽略
+        :return:    名字新增或改变的邮箱 {邮箱: 名字}
+        """
+        # 与已加入的姓名规范化后相同的姓名忽略
+        author_list, _ = _unique_authors(author_list, range(len(author_list)), self.__normalized_authors)
+        author_offset = len(self.author_list)
+        self.author_list.extend(author_list)
+        if not author_list or not self.email_list:
+            return {}
+        return self.__correlate(self.email_list, author_list, author_offset)
+
+    def add_emails(self, email_list):
+        """
+            加入邮箱，只计算新邮箱与已有姓名的权重，已加入的邮箱忽略
+        :return:    名字新增或改变的邮箱 {邮箱: 名字}
+        """
+        email_list = [
+            email for email in dict.fromkeys(email_list) if '@' in email and email not in self.__known_emails
+        ]
+        self.email_list.extend(email_list)
+        self.__known_emails.update(email_list)
+        if not email_list or not self.author_list:
+            return {}
+        return self.__correlate(email_list, self.author_list, 0)
+
+    @property
+    def email_owners(self):
+        return self.storager.email_owners
+
+
+def correlation(email_list: list, author_list: list, keep_original=False, debug=False, engine='regex',
+                prune=False, stats=None, verbose=True, tracer=None, cache=None, vectorized=False, top_k=1,
+                min_margin=None, storager=None, one_to_one=False, profile_index=None, author_positions=None,
+                early_exit=False):
+    """
+        匹配邮箱对应的名字
+    :param email_list:  邮箱列表
+    :param author_list: 姓名列表
+    :param debug:       是否打印调试
+    :param verbose:     是否打印匹配结果的更新过程
+    :param engine:      匹配引擎，'regex' 逐个姓名运行正则，'aho-corasick' 整批姓名构造一个自动机，
+                        只对命中特征或首字母的姓名计算权重（结果不变，跳过的姓名不产生跟踪事件）
+    :param prune:       是否通过倒排索引和权重上界跳过不可能胜出的姓名（结果不变）
+    :param stats:       CorrelationStats 对象，用于记录组合数以及剪枝数
+    :param tracer:      Tracer 对象，接收每个阶段的匹配事件以及结果更新
+    :param cache:       ScoreCache 对象，多次调用之间共享用户名部分与姓名的权重
+    :param vectorized:  是否使用 NumPy 批量计算权重上界，只对上界可能胜出的姓名计算权重（结果不变）
+    :param top_k:       每个邮箱保留的候选名字数量，可通过 Storager.email_candidates 查看候选名字及各阶段权重
+    :param min_margin:  最优名字与次优名字的最小权重差，差值不足的邮箱不出现在结果中
+    :param storager:    Storager 对象，用于在调用后查看候选名字，传入时忽略 top_k 和 min_margin
+    :param one_to_one:  是否一对一分配，每个名字最多分配给一个邮箱，并使所有超过阈值的权重的分配总和最大
+    :param profile_index:   ProfileIndex 对象，从索引文件读取预先构造的姓名特征，不在索引中的姓名照常构造
+    :param author_positions:    姓名分片中每个姓名在完整姓名列表中的位置，与 Storager(keep_log=True) 一起使用，
+                                各分片的 Storager 可以通过 Storager.merge 合并
+    :param early_exit:  计算权重时是否在每个阶段之后估算权重上界，无法胜出时跳过剩余阶段（结果不变，
+                        跳过的阶段不产生跟踪事件）
+    :return:            匹配邮箱对应名字结果
+    """
+
+    # 打印也通过跟踪接口完成，都未开启时跟踪不产生任何开销
+    if verbose or debug:
+        print_tracer = PrintTracer(verbose=verbose, debug=debug)
+        tracer = print_tracer if tracer is None else TracerGroup([print_tracer, tracer])
+
+    if storager is None:
+        storager = Storager(top_k=top_k, min_margin=min_margin)
+    # 一对一分配需要所有超过阈值的权重
+    email_weights = {} if one_to_one else None
+    for email, updates, candidates in _iter_correlation(email_list=email_list, author_list=author_list,
+                                                        keep_original=keep_original, engine=engine, prune=prune,
+                                                        stats=stats, tracer=tracer, cache=cache,
+                                                        vectorized=vectorized,
+                                                        candidates=storager.track_candidates or one_to_one,
+                                                        profile_index=profile_index,
+                                                        author_positions=author_positions, early_exit=early_exit):
+        for name, name_weight in updates:
+            storager.update(email=email, name=name, name_weight=name_weight)
+        if storager.track_candidates:
+            for name, name_weight, stages, position, raw_weight in candidates:
+                storager.add_candidate(email=email, name=name, name_weight=name_weight, stages=stages,
+                                       position=position, raw_weight=raw_weight)
+        if email_weights is not None:
+            weights = email_weights.setdefault(email, {})
+            for name, name_weight, *_ in candidates:
+                if name_weight > weights.get(name, 0):
+                    weights[name] = name_weight
 
     # 返回匹配结果
+    if email_weights is not None:
+        return assign_one_to_one(email_weights)
     return storager.email_owners
 
 
+# 工作进程（线程）共享的权重缓存
+_worker_score_cache = None
+
+
+def correlate_chunk(chunk, options):
+    """
+        在工作进程（线程）中匹配一组记录，correlate_many 以及 correlation_server 提交给工作池的任务
+    :param chunk:   [(邮箱列表, 姓名列表)]
+    :param options: 传递给 correlation 的参数，以及 cache_size：工作进程（线程）中共享的权重缓存容量
+    :return:        每条记录的匹配结果
+    """
+    global _worker_score_cache
+
+    options = dict(options)
+    cache_size = options.pop('cache_size', None)
+    if cache_size:
+        if _worker_score_cache is None or _worker_score_cache.maxsize != cache_size:
+            _worker_score_cache = ScoreCache(maxsize=cache_size)
+        options['cache'] = _worker_score_cache
+    return [
+        correlation(email_list=email_list, author_list=author_list, verbose=False, **options)
+        for email_list, author_list in chunk
+    ]
+
+
+def _record_lists(record):
+    # 记录可以是 (邮箱列表, 姓名列表) 或包含 email_list、author_list 的字典
+    if isinstance(record, dict):
+        return record['email_list'], record['author_list']
+    email_list, author_list = record
+    return email_list, author_list
+
+
+def correlate_many(records, workers=None, chunksize=1, ordered=True, executor='auto', **options):
+    """
+        批量匹配多条互相独立的记录
+        记录按 chunksize 分组后分发到进程池（或线程池），同时提交的分组数量有上限，因此可以处理任意长的记录流；
+        每个工作进程缓存已构造的姓名特征，重复出现的姓名不会重复构造
+    :param records:     可迭代的记录，每条记录为 (邮箱列表, 姓名列表) 或包含 email_list、author_list 的字典
+    :param workers:     进程（线程）数量，默认为 CPU 数量
+    :param chunksize:   每次分发的记录数量
+    :param ordered:     是否按输入顺序产出结果，否则按完成顺序产出
+    :param executor:    'process' 进程池，'thread' 线程池，'auto' 记录较少时使用线程池
+    :param options:     传递给 correlation 的其它参数（keep_original、engine、prune、vectorized、early_exit、top_k、min_margin、
+                        one_to_one、profile_index：工作进程通过路径重新打开同一个索引文件），
+                        以及 cache_size：每个工作进程保留的权重缓存容量，在多次分发之间共享
+    :return:            生成器，ordered 为真时产出每条记录的匹配结果，否则产出 (记录序号, 匹配结果)
+    """
+
+    if executor not in ('auto', 'process', 'thread'):
+        raise ValueError("Unknown executor %r, expected 'auto', 'process' or 'thread'." % executor)
+    if chunksize < 1:
+        raise ValueError('chunksize must be >= 1.')
+    for option in options:
+        if option not in ('keep_original', 'engine', 'prune', 'vectorized', 'early_exit', 'top_k', 'min_margin',
+                          'one_to_one', 'profile_index', 'cache_size'):
+            raise TypeError('correlate_many() got an unexpected keyword argument %r' % option)
+
+    if executor == 'auto':
+        is_small_batch = hasattr(records, '__len__') and len(records) < SMALL_BATCH_SIZE
+        executor = 'thread' if is_small_batch else 'process'
+    executor_class = {
+        'process': concurrent.futures.ProcessPoolExecutor,
+        'thread': concurrent.futures.ThreadPoolExecutor,
+    }[executor]
+
+    # 同时提交的分组数量上限
+    max_pending = 2 * (workers or os.cpu_count() or 1)
+
+    with executor_class(max_workers=workers) as pool:
+        pending = collections.deque()
+
+        def chunks():
+            chunk = []
+            for index, record in enumerate(records):
+                chunk.append((index, _record_lists(record)))
+                if len(chunk) >= chunksize:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+        def submit(chunk):
+            indexes = [index for index, _ in chunk]
+            future = pool.submit(correlate_chunk, [lists for _, lists in chunk], options)
+            pending.append((indexes, future))
+
+        for chunk in chunks():
+            submit(chunk)
+            if len(pending) < max_pending:
+                continue
+            if ordered:
+                indexes, future = pending.popleft()
+                yield from future.result()
+            else:
+                concurrent.futures.wait([future for _, future in pending],
+                                        return_when=concurrent.futures.FIRST_COMPLETED)
+                for indexes, future in [item for item in pending if item[1].done()]:
+                    pending.remove((indexes, future))
+                    yield from zip(indexes, future.result())
+
+        # 取出剩余结果
+        if ordered:
+            while pending:
+                indexes, future = pending.popleft()
+                yield from future.result()
+        else:
+            futures = {future: indexes for indexes, future in pending}
+            for future in concurrent.futures.as_completed(futures):
+                yield from zip(futures[future], future.result())
+
+
+def correlate_stream(records, **options):
+    """
+        流式匹配多条记录
+        逐条读取记录，每个邮箱的最优名字确定后立即产出，不保存任何匹配结果，内存占用与输入大小无关
+    :param records:     可迭代的记录，格式与 correlate_many 相同
+    :param options:     传递给 correlation 的其它参数（keep_original、engine、prune、vectorized、early_exit、stats、tracer、
+                        cache、profile_index）
+    :return:            生成器，产出 (邮箱, 名字, 权重)，没有匹配到名字的邮箱不产出
+    """
+
+    for option in options:
+        if option not in ('keep_original', 'engine', 'prune', 'vectorized', 'early_exit', 'stats', 'tracer', 'cache',
+                          'profile_index'):
+            raise TypeError('correlate_stream() got an unexpected keyword argument %r' % option)
+
+    for record in records:
+        email_list, author_list = _record_lists(record)
+        # 同一条记录中重复的邮箱结果相同，只匹配一次
+        email_list = list(dict.fromkeys(email_list))
+        for email, updates, _ in _iter_correlation(email_list=email_list, author_list=author_list, **options):
+            if updates:
+                # 与 Storager 相同，取权重最高的更新（权重相同时取先出现的）
+                name, name_weight = max(updates, key=lambda update: update[1])
+                yield email, name, name_weight
+
+
+# 命令行 CSV 输入中列表字段的分隔符
+CSV_LIST_SEPARATOR = ';'
+
+
+def _read_records(input_file, input_format):
+    """
+        逐行读取记录
+        JSONL 每行为包含 email_list、author_list（以及可选 id）的对象；
+        CSV 需要 email_list、author_list（以及可选 id）列，列表以分号分隔
+    """
+    if input_format == 'csv':
+        for row in csv.DictReader(input_file):
+            yield {
+                'id': row.get('id'),
+                'email_list': [email.strip() for email in row['email_list'].split(CSV_LIST_SEPARATOR)],
+                'author_list': [author.strip() for author in row['author_list'].split(CSV_LIST_SEPARATOR)],
+            }
+    else:
+        for line in input_file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def main(argv=None):
+    """
+        命令行入口：读取 JSONL/CSV 记录，逐个邮箱输出 JSONL 匹配结果
+    """
+
+    parser = argparse.ArgumentParser(description='Guess the owners of e-mails from author names.')
+    parser.add_argument('input', help="JSONL or CSV file of records, '-' for stdin")
+    parser.add_argument('-f', '--format', choices=('jsonl', 'csv'),
+                        help='input format, guessed from the file extension by default')
+    parser.add_argument('-o', '--output', default='-', help="JSONL output file, '-' for stdout (default)")
+    parser.add_argument('--keep-original', action='store_true', help='output author names as given')
+    parser.add_argument('--engine', choices=tuple(ENGINES), default='regex', help='matching engine')
+    parser.add_argument('--prune', action='store_true', help='skip authors that cannot win')
+    parser.add_argument('--vectorized', action='store_true', help='compute upper bounds in bulk with NumPy')
+    parser.add_argument('--early-exit', action='store_true', help='stop scoring an author once it cannot win')
+    parser.add_argument('--stage-stats', action='store_true', help='print per-stage counters and timings to stderr')
+    parser.add_argument('--cache-size', type=int, default=SCORE_CACHE_SIZE,
+                        help='number of (user part, author) weights to cache, 0 to disable')
+    args = parser.parse_args(argv)
+
+    score_cache = ScoreCache(maxsize=args.cache_size) if args.cache_size > 0 else None
+
+    stage_profiler = StageProfiler() if args.stage_stats else None
+
+    input_format = args.format
+    if input_format is None:
+        input_format = 'csv' if args.input.lower().endswith('.csv') else 'jsonl'
+
+    input_file = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8', newline='')
+    output_file = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        for index, record in enumerate(_read_records(input_file, input_format)):
+            record_id = record.get('id')
+            if record_id is None:
+                record_id = index
+            for email, name, name_weight in correlate_stream([record], keep_original=args.keep_original,
+                                                             engine=args.engine, prune=args.prune,
+                                                             vectorized=args.vectorized, early_exit=args.early_exit,
+                                                             tracer=stage_profiler,
+                                                             cache=score_cache):
+                output_file.write(json.dumps({'id': record_id, 'email': email, 'name': name, 'weight': name_weight},
+                                             ensure_ascii=False) + '\n')
+            # 每条记录处理完即写出
+            output_file.flush()
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+
+    if stage_profiler is not None:
+        print(stage_profiler.report(), file=sys.stderr)
+    return 0
+
+
 if __name__ == '__main__':
-    import json
+    # 有命令行参数时读取记录文件，否则运行示例
+    if len(sys.argv) > 1:
+        sys.exit(main())
 
     email_list = [
         'dradenoy@ybb.ne.jp',
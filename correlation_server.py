@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+    以 asyncio 服务的方式提供 correlation
+
+    通过 TCP 或 Unix socket 收发以换行分隔的 JSON（每行一个请求或响应），连接建立后可以连续发送多个请求，
+    响应按完成顺序返回，以 id 对应请求。
+    短时间内到达、姓名列表以及选项相同的请求合并为一批，只调用一次 correlation；
+    每个邮箱的结果只取决于该邮箱与姓名列表，因此合并后每个请求的结果与单独调用完全相同。
+    计算在进程池（或线程池）中进行，不阻塞事件循环；正在处理的请求数量达到上限时暂停读取连接。
+
+    请求：  {"id": 1, "email_list": [...], "author_list": [...], "keep_original": false}
+    响应：  {"id": 1, "result": {"邮箱": "名字"}, "latency": 0.0123}
+    统计：  {"id": 2, "metrics": true}，返回请求数、批次数以及延迟分位数
+
+    e.g. python correlation_server.py --port 8765
+         python correlation_server.py --unix /tmp/correlation.sock --executor thread
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import collections
+import concurrent.futures
+
+from correlation_algorithm import SCORE_CACHE_SIZE, correlate_chunk
+
+# 合并请求的等待时间（秒）
+BATCH_WINDOW = 0.005
+# 每批最多包含的邮箱数量，超过时立即开始计算
+MAX_BATCH_EMAILS = 4096
+# 同时处理的请求数量上限
+MAX_PENDING_REQUESTS = 1024
+# 单行请求的最大长度
+MAX_LINE_SIZE = 16 * 1024 * 1024
+# 计算延迟分位数时保留的最近请求数量
+LATENCY_SAMPLES = 10000
+
+
+def percentile(values, percent):
+    """
+        计算分位数（取排序后最接近的值）
+    :param values:  数值列表
+    :param percent: 百分位（0～100）
+    :return:        分位数，列表为空时返回 None
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(percent / 100.0 * (len(values) - 1))))]
+
+
+class _Batch(object):
+    """
+        等待合并计算的一批请求
+    """
+
+    __slots__ = ('emails', 'waiters', 'flushed')
+
+    def __init__(self):
+        # 去重后的邮箱（保持顺序）以及 (请求的邮箱列表, future)
+        self.emails = {}
+        self.waiters = []
+        self.flushed = False
+
+
+class CorrelationServer(object):
+    """
+        合并请求并在工作池中计算的 correlation 服务
+    """
+
+    def __init__(self, executor='process', workers=None, batch_window=BATCH_WINDOW, max_batch_emails=MAX_BATCH_EMAILS,
+                 max_pending=MAX_PENDING_REQUESTS, cache_size=SCORE_CACHE_SIZE):
+        """
+        :param executor:            'process' 进程池，'thread' 线程池
+        :param workers:             进程（线程）数量，默认为 CPU 数量
+        :param batch_window:        合并请求的等待时间（秒）
+        :param max_batch_emails:    每批最多包含的邮箱数量
+        :param max_pending:         同时处理的请求数量上限，达到上限时暂停读取连接
+        :param cache_size:          每个工作进程保留的权重缓存容量，0 表示不缓存
+        """
+        if executor not in ('process', 'thread'):
+            raise ValueError("Unknown executor %r, expected 'process' or 'thread'." % executor)
+        self.__executor_class = {
+            'process': concurrent.futures.ProcessPoolExecutor,
+            'thread': concurrent.futures.ThreadPoolExecutor,
+        }[executor]
+        self.__workers = workers
+        self.executor = self.__executor_class(max_workers=workers)
+        self.batch_window = batch_window
+        self.max_batch_emails = max_batch_emails
+        self.cache_size = cache_size
+        self.__pending = asyncio.Semaphore(max_pending)
+        # {(姓名列表, keep_original): _Batch}
+        self.__batches = {}
+
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.__latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+
+    async def correlate(self, email_list, author_list, keep_original=False):
+        """
+            匹配邮箱对应的名字，与 correlation 的结果相同
+        """
+        loop = asyncio.get_running_loop()
+        key = (tuple(author_list), bool(keep_original))
+        batch = self.__batches.get(key)
+        if batch is None:
+            batch = self.__batches[key] = _Batch()
+            loop.call_later(self.batch_window, self.__flush, key, batch)
+
+        future = loop.create_future()
+        batch.waiters.append((email_list, future))
+        for email in email_list:
+            batch.emails.setdefault(email, None)
+        if len(batch.emails) >= self.max_batch_emails:
+            self.__flush(key, batch)
+        return await future
+
+    def __flush(self, key, batch):
+        if batch.flushed:
+            return
+        batch.flushed = True
+        if self.__batches.get(key) is batch:
+            del self.__batches[key]
+        self.batches += 1
+        self.batched_requests += len(batch.waiters)
+
+        def fail(error):
+            # 所有请求都必须得到响应，否则会一直占用处理中的请求数量
+            for _, future in batch.waiters:
+                if not future.done():
+                    future.set_exception(error)
+
+        def distribute(task):
+            if task.cancelled():
+                fail(asyncio.CancelledError())
+                return
+            error = task.exception()
+            if error is not None:
+                self.__replace_broken_executor(executor, error)
+                fail(error)
+                return
+            # 与单独调用相同，按请求中邮箱的顺序返回有结果的邮箱
+            result = task.result()[0]
+            for email_list, future in batch.waiters:
+                if not future.done():
+                    future.set_result({
+                        email: result[email] for email in dict.fromkeys(email_list) if email in result
+                    })
+
+        author_list, keep_original = key
+        # 与 correlate_many 共用工作进程（线程）中的权重缓存
+        options = {'keep_original': keep_original, 'cache_size': self.cache_size}
+        executor = self.executor
+        try:
+            task = asyncio.get_running_loop().run_in_executor(executor, correlate_chunk,
+                                                              [(list(batch.emails), list(author_list))], options)
+        except Exception as error:
+            # 工作进程异常退出后进程池不再接受任务，提交时直接抛出异常
+            self.__replace_broken_executor(executor, error)
+            fail(error)
+            return
+        task.add_done_callback(distribute)
+
+    def __replace_broken_executor(self, executor, error):
+        # 进程池损坏后重新创建，之后的请求使用新的进程池（同一个进程池只替换一次）
+        if not isinstance(error, concurrent.futures.BrokenExecutor) or self.executor is not executor:
+            return
+        self.executor = self.__executor_class(max_workers=self.__workers)
+        executor.shutdown(wait=False)
+
+    async def handle(self, request):
+        """
+            处理一个请求
+        :param request: 请求字典
+        :return:        响应字典
+        """
+        started = time.perf_counter()
+        request_id = request.get('id') if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict):
+                raise ValueError('request must be a JSON object')
+            if request.get('metrics'):
+                return {'id': request_id, 'metrics': self.metrics()}
+            email_list = request['email_list']
+            author_list = request['author_list']
+            # 同一批的请求共享一次计算，错误的请求不能进入批次
+            for values in (email_list, author_list):
+                if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+                    raise ValueError('email_list and author_list must be lists of strings')
+            self.requests += 1
+            result = await self.correlate(email_list=email_list, author_list=author_list,
+                                          keep_original=request.get('keep_original', False))
+        except Exception as error:
+            self.errors += 1
+            return {'id': request_id, 'error': '%s: %s' % (error.__class__.__name__, error)}
+        latency = time.perf_counter() - started
+        self.__latencies.append(latency)
+        return {'id': request_id, 'result': result, 'latency': latency}
+
+    def metrics(self):
+        latencies = list(self.__latencies)
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'batches': self.batches,
+            'requests_per_batch': self.batched_requests / self.batches if self.batches else None,
+            'latency_p50': percentile(latencies, 50),
+            'latency_p95': percentile(latencies, 95),
+            'latency_p99': percentile(latencies, 99),
+        }
+
+    async def handle_connection(self, reader, writer):
+        """
+            逐行读取请求，每个请求单独处理，完成后写回响应
+        """
+        write_lock = asyncio.Lock()
+        tasks = set()
+
+        async def respond(line):
+            try:
+                try:
+                    request = json.loads(line)
+                except ValueError as error:
+                    self.errors += 1
+                    response = {'id': None, 'error': 'ValueError: invalid JSON: %s' % error}
+                else:
+                    response = await self.handle(request)
+                async with write_lock:
+                    writer.write((json.dumps(response, ensure_ascii=False) + '\n').encode('utf-8'))
+                    await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                self.__pending.release()
+
+        try:
+            while True:
+                # 处理中的请求达到上限时不再读取，由 TCP 流量控制通知客户端
+                await self.__pending.acquire()
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, ValueError):
+                    line = b''
+                if not line.strip():
+                    self.__pending.release()
+                    if not line:
+                        break
+                    continue
+                task = asyncio.ensure_future(respond(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    async def serve_tcp(self, host='127.0.0.1', port=8765):
+        server = await asyncio.start_server(self.handle_connection, host=host, port=port, limit=MAX_LINE_SIZE)
+        async with server:
+            await server.serve_forever()
+
+    async def serve_unix(self, path):
+        server = await asyncio.start_unix_server(self.handle_connection, path=path, limit=MAX_LINE_SIZE)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve correlation() over newline-delimited JSON.')
+    parser.add_argument('--host', default='127.0.0.1', help='TCP host to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='TCP port to listen on')
+    parser.add_argument('--unix', help='listen on this Unix socket path instead of TCP')
+    parser.add_argument('--executor', choices=('process', 'thread'), default='process', help='worker pool type')
+    parser.add_argument('--workers', type=int, help='number of workers, the CPU count by default')
+    parser.add_argument('--batch-window', type=float, default=BATCH_WINDOW,
+                        help='seconds to wait for requests sharing an author list')
+    parser.add_argument('--max-batch-emails', type=int, default=MAX_BATCH_EMAILS, help='emails per batch')
+    parser.add_argument('--max-pending', type=int, default=MAX_PENDING_REQUESTS,
+                        help='requests in flight before reading pauses')
+    parser.add_argument('--cache-size', type=int, default=SCORE_CACHE_SIZE,
+                        help='number of (user part, author) weights to cache per worker, 0 to disable')
+    args = parser.parse_args(argv)
+
+    async def serve():
+        server = CorrelationServer(executor=args.executor, workers=args.workers, batch_window=args.batch_window,
+                                   max_batch_emails=args.max_batch_emails, max_pending=args.max_pending,
+                                   cache_size=args.cache_size)
+        try:
+            if args.unix:
+                await server.serve_unix(args.unix)
+            else:
+                await server.serve_tcp(args.host, args.port)
+        finally:
+            server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())